@@ -0,0 +1,236 @@
+"""
+Batch Runner
+=============================================================
+Parameter sweeps of the TrafficModel over a pool of worker processes.
+Every combination of the parameter grid is run for a number of
+replicates, each with its own deterministic seed, and the summary of
+every run is appended to a columnar file as soon as the run finishes.
+Results go to Parquet when pyarrow is installed, to CSV otherwise.
+The maps of the sweep are compiled once before the runs start, and the
+workers load the compiled files instead of rebuilding each map.
+"""
+
+import argparse
+import csv
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from SessionPool import CompiledMaps, build_model
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+def parameter_grid(parameters):
+    """Expand a dict of parameter lists into every combination."""
+    names = list(parameters)
+    return [
+        dict(zip(names, values))
+        for values in itertools.product(*(parameters[name] for name in names))
+    ]
+
+
+def run_seeds(seed, count):
+    """Derive one independent seed per run from a root seed.
+
+    Each run gets its own substream of the root SeedSequence, so runs do
+    not overlap and a run can be replayed alone from its seed.
+    """
+    return [
+        int(child.generate_state(1)[0])
+        for child in np.random.SeedSequence(seed).spawn(count)
+    ]
+
+
+def run_model(run_id, params, replicate, seed, steps, map_path=None):
+    """Run one model for a number of steps and summarize it."""
+    start = time.perf_counter()
+    # Only the final state is summarized, so only the last step is collected
+    model = build_model(
+        seed=seed, map_path=map_path, **{"collect_interval": steps or 1, **params}
+    )
+    for _ in range(steps):
+        model.step()
+
+    cars = list(model.cars.values())
+    distances = [agent.distance_travelled for agent in cars]
+    summary = {
+        "run_id": run_id,
+        **params,
+        "replicate": replicate,
+        "seed": seed,
+        "steps": steps,
+        "cars": len(cars),
+        "parked": sum(not agent.active for agent in cars),
+        "distance_travelled": int(sum(distances)),
+        "mean_distance_travelled": float(np.mean(distances)) if cars else 0.0,
+        "elapsed": time.perf_counter() - start,
+    }
+    # Workers run many models, each one is freed as soon as it is summarized
+    model.release()
+    return summary
+
+
+def axis_type(values):
+    """Arrow type of a parameter axis, nullable when it holds None.
+
+    Integers mixed with floats are widened to float64, so no run of the
+    axis is truncated to the type of the first one.
+    """
+    present = [value for value in values if value is not None]
+    if not present:
+        return pa.null()
+    if all(isinstance(value, bool) for value in present):
+        return pa.bool_()
+    numbers = [
+        value
+        for value in present
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    ]
+    if len(numbers) == len(present):
+        if all(isinstance(value, int) for value in numbers):
+            return pa.int64()
+        return pa.float64()
+    return pa.array(present).type
+
+
+def result_schema(parameters):
+    """Arrow schema of the summaries of a sweep, from its whole parameter grid."""
+    parameters = {name: list(values) for name, values in parameters.items()}
+    return pa.schema(
+        [("run_id", pa.int64())]
+        + [(name, axis_type(values)) for name, values in parameters.items()]
+        + [
+            ("replicate", pa.int64()),
+            ("seed", pa.int64()),
+            ("steps", pa.int64()),
+            ("cars", pa.int64()),
+            ("parked", pa.int64()),
+            ("distance_travelled", pa.int64()),
+            ("mean_distance_travelled", pa.float64()),
+            ("elapsed", pa.float64()),
+        ]
+    )
+
+
+class ResultWriter:
+    def __init__(self, path, schema=None):
+        self.path = path
+        # Parquet schema of the rows, inferred from the first batch if not given
+        self.schema = schema
+        self.writer = None
+        self.file = None
+
+    def write(self, rows):
+        """Append a batch of result rows to the file."""
+        if not rows:
+            return
+        if pa is not None:
+            if self.writer is None:
+                if self.schema is None:
+                    self.schema = pa.Table.from_pylist(rows).schema
+                self.writer = pq.ParquetWriter(self.path, self.schema)
+            self.writer.write_table(pa.Table.from_pylist(rows, schema=self.schema))
+        else:
+            if self.writer is None:
+                self.file = open(self.path, "w", newline="")
+                self.writer = csv.DictWriter(self.file, fieldnames=list(rows[0]))
+                self.writer.writeheader()
+            self.writer.writerows(rows)
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        elif self.writer is not None:
+            self.writer.close()
+
+
+def run_sweep(
+    parameters,
+    replicates=1,
+    steps=100,
+    seed=0,
+    output="sweep.parquet",
+    max_workers=None,
+    flush_every=1,
+):
+    """Run every parameter combination for a number of replicates.
+
+    Runs are spread over a ProcessPoolExecutor and their summaries are
+    written to `output` in batches of `flush_every` runs as they finish.
+    Returns the number of runs.
+    """
+    tasks = [
+        (params, replicate)
+        for params in parameter_grid(parameters)
+        for replicate in range(replicates)
+    ]
+    seeds = run_seeds(seed, len(tasks))
+
+    maps = CompiledMaps()
+    # The types of every axis are known before any run finishes
+    writer = ResultWriter(output, result_schema(parameters) if pa is not None else None)
+    pending = []
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(
+                    run_model,
+                    run_id,
+                    params,
+                    replicate,
+                    seeds[run_id],
+                    steps,
+                    maps.path(params.get("map", "default")),
+                )
+                for run_id, (params, replicate) in enumerate(tasks)
+            ]
+            for future in as_completed(futures):
+                pending.append(future.result())
+                if len(pending) >= flush_every:
+                    writer.write(pending)
+                    pending = []
+        writer.write(pending)
+    finally:
+        writer.close()
+        maps.cleanup()
+    return len(tasks)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a TrafficModel parameter sweep")
+    parser.add_argument("--num-agents", type=int, nargs="+", default=[10])
+    parser.add_argument("--map", nargs="+", default=["default"])
+    parser.add_argument("--engine", nargs="+", default=["agents"])
+    parser.add_argument("--signal-controller", nargs="+", default=["greedy"])
+    parser.add_argument("--replicates", type=int, default=1)
+    parser.add_argument("--steps", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument(
+        "--output", default="sweep.parquet" if pa is not None else "sweep.csv"
+    )
+    args = parser.parse_args()
+
+    runs = run_sweep(
+        {
+            "num_agents": args.num_agents,
+            "map": args.map,
+            "engine": args.engine,
+            "signal_controller": args.signal_controller,
+        },
+        replicates=args.replicates,
+        steps=args.steps,
+        seed=args.seed,
+        output=args.output,
+        max_workers=args.workers,
+    )
+    print(f"{runs} runs written to {args.output}")
@@ -1,116 +1,90 @@
 import mesa
-import numpy as np
-import random
+
+from RoadNetwork import MOVE_DIRECTIONS
 
 
 class CarAgent(mesa.Agent):
     def __init__(self, model, spawn_position, target_parking_spot=None):
         super().__init__(model)
+        self.start_trip(spawn_position, target_parking_spot)
+
+    def start_trip(self, spawn_position, target_parking_spot=None):
+        """Set up the car for a trip from its spawn to its target."""
         self.active = True
-        self.parking_spots = [
-            coord for coord in model.parkings_coords if coord != spawn_position
-        ]
+        # Keys of the spawn and target parking spots, 0 when there is none
+        self.spawn_id = int(self.model.parking_id[spawn_position])
+        self.target_id = (
+            0
+            if target_parking_spot is None
+            else int(self.model.parking_id[target_parking_spot])
+        )
         self.distance_travelled = 0
-        self.target_parking_spot = target_parking_spot
-        print(f"Target parking spot: {self.target_parking_spot}")
+
+    def reuse(self, spawn_position, target_parking_spot=None):
+        """Register a car taken back from the pool under a new unique id."""
+        self.unique_id = next(self._ids[self.model])
+        self.pos = None
+        self.model.register_agent(self)
+        self.start_trip(spawn_position, target_parking_spot)
+
+    @property
+    def target_parking_spot(self):
+        """Position of the target parking spot, None when there is none."""
+        return self.model.ParkingSpots.get(self.target_id)
 
     def check_semaphore(self, current_position):
         """Check the semaphore state at the current position."""
-        from TrafficLightAgent import TrafficLightAgent
-
-        agents_at_position = self.model.grid.get_cell_list_contents([current_position])
-        semaphore_agent = None
-        for agent in agents_at_position:
-            if agent.__class__ == TrafficLightAgent:
-                semaphore_agent = agent
-        if semaphore_agent is None:
+        light_index = self.model.traffic_light_grid[current_position]
+        if light_index < 0:
+            return True
+        if self.model.traffic_lights[light_index].state == 2:
             return True
-        else:
-            if semaphore_agent.state == 1:
-                return False
-            elif semaphore_agent.state == 2:
-                return True
+        self.model.profiler.count("blocked_by_semaphore")
+        return False
 
     def check_agent(self, new_position):
         """Check if there is another car agent at the new position."""
-        agents_at_position = self.model.grid.get_cell_list_contents([new_position])
-        car_agent = None
-        for agent in agents_at_position:
-            if agent.__class__ == CarAgent:
-                car_agent = agent
-        return car_agent is None
+        if self.model.car_grid[new_position] == 0:
+            return True
+        self.model.profiler.count("blocked_by_agent")
+        return False
 
     def move(self):
-        """Move the agent to a new position."""
+        """Move the agent to a random legal position."""
         current_position = self.pos
-        possible_current_directions = self.model.get_cell_directions(current_position)
-
-        if not possible_current_directions:
-            return
-
-        possible_directions = self.get_possible_directions(possible_current_directions)
-        if not possible_directions:
-            return
-
         if not self.check_semaphore(current_position):
             return
 
-        direction = self.choose_direction(possible_directions)
-        new_position = self.calculate_new_position(direction)
-
-        while (
-            new_position in self.model.parkings_coords
-            and new_position != self.target_parking_spot
-        ):
-            direction = self.choose_direction(possible_directions)
-            new_position = self.calculate_new_position(direction)
+        # Parking spots other than the target are already left out
+        direction = self.model.move_table.choose(
+            current_position, self.target_parking_spot, self.random.random()
+        )
+        if direction < 0:
+            return
+        new_position = self.calculate_new_position(MOVE_DIRECTIONS[direction])
 
         if not self.check_agent(new_position):
             return
 
         self.update_position(new_position)
 
-    def get_possible_directions(self, possible_current_directions):
-        """Get the list of possible directions the agent can move to."""
-        return [
-            direction
-            for direction, allowed in possible_current_directions.items()
-            if allowed
-        ]
-
-    def choose_direction(self, possible_directions):
-        """Choose a direction to move to based on predefined weights."""
-        direction_weights = {
-            "up": 1,
-            "down": 1,
-            "left": 1,
-            "right": 1,
-            "down_left": 0.1,
-            "down_right": 0.1,
-            "up_left": 0.1,
-            "up_right": 0.1,
-        }
-        weights = [direction_weights[direction] for direction in possible_directions]
-        return random.choices(possible_directions, weights=weights, k=1)[0]
-
     def calculate_new_position(self, direction):
         """Calculate the new position based on the direction."""
-        direction_map = {
-            "up": (0, 1),
-            "down": (0, -1),
-            "left": (-1, 0),
-            "right": (1, 0),
-            "down_left": (-1, -1),
-            "down_right": (1, -1),
-            "up_left": (-1, 1),
-            "up_right": (1, 1),
-        }
-        dx, dy = direction_map[direction]
-        return (self.pos[0] + dx, self.pos[1] + dy)
+        return self.model.road_network.successor(self.pos, direction)
 
     def update_position(self, new_position):
         """Update the agent's position on the grid."""
+        spot = self.model.parking_id[self.pos]
+        if spot:
+            self.model.parking_manager.depart(int(spot))
+        self.model.car_grid[self.pos] = 0
         self.model.grid.move_agent(self, new_position)
+        self.model.car_grid[new_position] = self.unique_id
+        spot = self.model.parking_id[new_position]
+        if spot:
+            self.model.parking_manager.occupy(int(spot))
+        self.model.dirty_cars.add(self)
+        self.model.profiler.count("moved")
         self.distance_travelled += 1
         self.pos = new_position
 
@@ -118,35 +92,21 @@ class CarAgent(mesa.Agent):
         """Move the agent intelligently towards the target parking spot."""
         current_position = self.pos
 
-        # Define specific area checks
-        area_checks = [
-            ([(22, 10), (22, 11)], [(20, 15), (20, 18), (17, 21)], "up"),
-            ([(22, 17), (22, 16)], [(17, 21)], "up"),
-            (
-                [(7, 11), (6, 11), (15, 11), (14, 11), (18, 1), (19, 1)],
-                [(2, 14), (5, 17), (20, 4), (10, 19), (3, 21)],
-                "up",
-            ),
-            ([(12, 22), (13, 22)], [(10, 19), (5, 17), (8, 15), (10, 12)], "down"),
-            ([(6, 8), (7, 8), (7, 4), (7, 5)], [(9, 2)], "down"),
-            ([(12, 17), (12, 18)], [(5, 17), (8, 15)], "down"),
-        ]
-
-        # Check if the agent is in a specific area and move accordingly
-        for area, targets, direction in area_checks:
-            if current_position in area and self.target_parking_spot in targets:
-                new_position = self.calculate_new_position(direction)
-                if not self.check_agent(new_position):
-                    return
-                self.update_position(new_position)
+        # Follow the shortest route when the target is reachable from here
+        next_direction = self.model.get_next_direction(
+            current_position, self.target_parking_spot
+        )
+        if next_direction is not None:
+            if not self.check_semaphore(current_position):
                 return
-
-        # Get possible moves and directions
-        possible_moves = self.model.get_cell_directions(current_position)
-        if not possible_moves:
+            new_position = self.calculate_new_position(next_direction)
+            if not self.check_agent(new_position):
+                return
+            self.update_position(new_position)
             return
 
-        possible_directions = self.get_possible_directions(possible_moves)
+        # Get possible directions
+        possible_directions = list(self.model.get_possible_directions(current_position))
         if not possible_directions:
             return
 
@@ -161,10 +121,8 @@ class CarAgent(mesa.Agent):
         new_position = self.calculate_new_position(best_direction)
 
         # Ensure the agent does not move to a parking spot that is not its target
-        while (
-            new_position in self.model.parkings_coords
-            and new_position != self.target_parking_spot
-        ):
+        while self.model.parking_id[new_position] not in (0, self.target_id):
+            self.model.profiler.count("rejection_retries")
             possible_directions.remove(best_direction)
             if not possible_directions:
                 return
@@ -197,14 +155,26 @@ class CarAgent(mesa.Agent):
 
         return best_direction
 
+    def park(self):
+        """Stop the agent at its current parking spot."""
+        self.model.parking_manager.arrive(int(self.model.parking_id[self.pos]))
+        self.active = False
+        self.model.moving_cars.discard(self)
+        self.model.schedule_retirement(self)
+        self.model.dirty_cars.add(self)
+
     def move_to_target(self):
         """Move towards the target parking spot."""
         while self.active:
-            if self.pos in self.parking_spots and self.distance_travelled > 0:
-                self.active = False
+            spot = self.model.parking_id[self.pos]
+            if spot and spot != self.spawn_id and self.distance_travelled > 0:
+                self.park()
                 break
             else:
-                moved = self.inteligent_move()
+                if not self.target_id:
+                    moved = self.move()
+                else:
+                    moved = self.inteligent_move()
                 if not moved:
                     break
 
@@ -0,0 +1,229 @@
+"""
+Columnar Collector
+=============================================================
+Low overhead data collection for a TrafficModel. Every sampled step
+appends the state of the cars and of the traffic lights as NumPy
+columns into preallocated chunks. Once the chunks in memory pass a
+size limit they are spilled to numbered part files on disk, Parquet
+when pyarrow is installed and CSV otherwise, so long runs keep a
+bounded footprint. Without a path the parts go to a temporary
+directory, deleted with the collector or by cleanup().
+"""
+
+import os
+import shutil
+import tempfile
+import weakref
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Columns of every table, with their types
+CAR_COLUMNS = {
+    "step": np.int32,
+    "id": np.int32,
+    "x": np.int16,
+    "y": np.int16,
+    "target": np.int32,
+    "active": np.bool_,
+    "distance_travelled": np.int32,
+}
+TRAFFIC_LIGHT_COLUMNS = {
+    "step": np.int32,
+    "light": np.int32,
+    "id": np.int32,
+    "state": np.int8,
+}
+
+
+class ChunkedTable:
+    def __init__(self, columns, chunk_size=65536):
+        self.columns = columns
+        self.chunk_size = chunk_size
+        self.chunks = []
+        # Rows used in the last chunk
+        self.used = chunk_size
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for chunk in self.chunks for column in chunk.values())
+
+    def __len__(self):
+        if not self.chunks:
+            return 0
+        return (len(self.chunks) - 1) * self.chunk_size + self.used
+
+    def append(self, **arrays):
+        """Append rows given as one array per column."""
+        rows = len(next(iter(arrays.values())))
+        start = 0
+        while start < rows:
+            if self.used == self.chunk_size:
+                self.chunks.append(
+                    {
+                        name: np.empty(self.chunk_size, dtype=dtype)
+                        for name, dtype in self.columns.items()
+                    }
+                )
+                self.used = 0
+            count = min(rows - start, self.chunk_size - self.used)
+            chunk = self.chunks[-1]
+            for name, values in arrays.items():
+                chunk[name][self.used : self.used + count] = values[
+                    start : start + count
+                ]
+            self.used += count
+            start += count
+
+    def arrays(self):
+        """Get the rows in memory as one array per column."""
+        if not self.chunks:
+            return {name: np.empty(0, dtype) for name, dtype in self.columns.items()}
+        return {
+            name: np.concatenate(
+                [chunk[name] for chunk in self.chunks[:-1]]
+                + [self.chunks[-1][name][: self.used]]
+            )
+            for name in self.columns
+        }
+
+    def clear(self):
+        self.chunks = []
+        self.used = self.chunk_size
+
+
+class PartWriter:
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.paths = []
+
+    def write(self, arrays):
+        """Write columns to a new part file."""
+        extension = "parquet" if pa is not None else "csv"
+        path = f"{self.prefix}_{len(self.paths):05d}.{extension}"
+        if pa is not None:
+            pq.write_table(pa.Table.from_pydict(arrays), path)
+        else:
+            pd.DataFrame(arrays).to_csv(path, index=False)
+        self.paths.append(path)
+
+    def read(self):
+        """Read back every part written, as DataFrames."""
+        if pa is not None:
+            return [pq.read_table(path).to_pandas() for path in self.paths]
+        return [pd.read_csv(path) for path in self.paths]
+
+
+class ColumnarCollector:
+    def __init__(
+        self,
+        model,
+        interval=1,
+        path=None,
+        memory_limit=256 * 2**20,
+        chunk_size=65536,
+    ):
+        self.model = model
+        # Collect every `interval` steps
+        self.interval = interval
+        self.memory_limit = memory_limit
+        self.cars = ChunkedTable(CAR_COLUMNS, chunk_size)
+        self.traffic_lights = ChunkedTable(TRAFFIC_LIGHT_COLUMNS, chunk_size)
+
+        # Part files the tables spill to, in a temporary directory made on
+        # the first spill when there is no path
+        self.path = path
+        self.writers = None
+        self.finalizer = None
+        if path is not None:
+            self.open_writers(path)
+
+        # The traffic lights never change, only their states are read
+        self.light_ids = np.array(
+            [light.unique_id for light in model.traffic_lights], dtype=np.int32
+        )
+
+    def collect(self):
+        """Record the state of the cars and traffic lights, on sampled steps."""
+        model = self.model
+        if model.steps % self.interval:
+            return
+
+        cars = list(model.cars.values())
+        self.cars.append(
+            step=np.full(len(cars), model.steps),
+            id=np.fromiter((agent.unique_id for agent in cars), np.int32, len(cars)),
+            x=np.fromiter((agent.pos[0] for agent in cars), np.int16, len(cars)),
+            y=np.fromiter((agent.pos[1] for agent in cars), np.int16, len(cars)),
+            target=np.fromiter(
+                (agent.target_id for agent in cars), np.int32, len(cars)
+            ),
+            active=np.fromiter((agent.active for agent in cars), np.bool_, len(cars)),
+            distance_travelled=np.fromiter(
+                (agent.distance_travelled for agent in cars), np.int32, len(cars)
+            ),
+        )
+
+        lights = model.traffic_lights
+        self.traffic_lights.append(
+            step=np.full(len(lights), model.steps),
+            light=np.arange(len(lights)),
+            id=self.light_ids,
+            state=np.fromiter((light.state for light in lights), np.int8, len(lights)),
+        )
+
+        if self.cars.nbytes + self.traffic_lights.nbytes > self.memory_limit:
+            self.spill()
+
+    def open_writers(self, path):
+        self.writers = {
+            "cars": PartWriter(f"{path}_cars"),
+            "traffic_lights": PartWriter(f"{path}_traffic_lights"),
+        }
+
+    def spill(self):
+        """Write the rows in memory to disk and free their chunks."""
+        if self.writers is None:
+            directory = tempfile.mkdtemp(prefix="collector_")
+            self.finalizer = weakref.finalize(
+                self, shutil.rmtree, directory, ignore_errors=True
+            )
+            self.open_writers(os.path.join(directory, "collected"))
+        for name, table in (
+            ("cars", self.cars),
+            ("traffic_lights", self.traffic_lights),
+        ):
+            if len(table):
+                self.writers[name].write(table.arrays())
+                table.clear()
+
+    def close(self):
+        """Write every remaining row to the path, if there is one."""
+        if self.path is not None:
+            self.spill()
+
+    def cleanup(self):
+        """Delete the temporary directory of the spilled rows, if there is one."""
+        if self.finalizer is not None:
+            self.finalizer()
+            self.finalizer = None
+            self.writers = None
+
+    def dataframe(self, name):
+        frames = self.writers[name].read() if self.writers is not None else []
+        frames.append(pd.DataFrame(getattr(self, name).arrays()))
+        return pd.concat(frames, ignore_index=True)
+
+    def get_cars_dataframe(self):
+        """Get every collected car row, spilled ones included."""
+        return self.dataframe("cars")
+
+    def get_traffic_lights_dataframe(self):
+        """Get every collected traffic light row, spilled ones included."""
+        return self.dataframe("traffic_lights")
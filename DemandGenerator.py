@@ -0,0 +1,33 @@
+"""
+Demand Generator
+=============================================================
+Continuous arrival of new trips into a running TrafficModel. Every
+step a Poisson number of cars, `rate` on average, leaves from a
+random parking spot towards another one, both drawn uniformly over the
+spots that are neither occupied nor reserved.
+"""
+
+
+class DemandGenerator:
+    def __init__(self, model, rate=0.0):
+        self.model = model
+        # Mean number of new trips per step
+        self.rate = rate
+
+    def step(self):
+        """Start the trips of the step, returns the new cars."""
+        if self.rate <= 0:
+            return []
+
+        model = self.model
+        parking = model.parking_manager
+        cars = []
+        for _ in range(model.rng.poisson(self.rate)):
+            origin = parking.random_available(model.random)
+            if origin is None:
+                break
+            destination = parking.random_available(model.random, exclude=origin)
+            if destination is None:
+                break
+            cars.append(model.add_car(origin, destination))
+        return cars
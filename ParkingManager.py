@@ -0,0 +1,243 @@
+"""
+Parking Manager
+=============================================================
+Occupancy and assignment of the parking spots of the city. Every spot
+is occupied while a car stands on it and reserved while a car drives
+towards it. Random draws over the spots keep the key order of the
+spots in a Fenwick tree, so they take O(log n) and pick the same spot
+as drawing from an ordered list. Nearest available spot queries search
+square buckets of cells around the position, wrapping around the edges
+when the manager is given the size of a toroidal grid.
+"""
+
+import numpy as np
+
+
+class SpotSet:
+    """Set of spot keys 1..n kept in key order, with O(log n) rank queries.
+
+    Starts with every key in it.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.members = np.ones(size + 1, dtype=bool)
+        self.members[0] = False
+        self.count = size
+        # Highest power of two of the tree, where the rank search starts
+        self.top = 1 << size.bit_length() if size else 0
+
+        # Build the tree of the full set in O(n)
+        self.tree = [0] * (size + 1)
+        for key in range(1, size + 1):
+            self.tree[key] += 1
+            parent = key + (key & -key)
+            if parent <= size:
+                self.tree[parent] += self.tree[key]
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, key):
+        return bool(self.members[key])
+
+    def update(self, key, delta):
+        while key <= self.size:
+            self.tree[key] += delta
+            key += key & -key
+
+    def add(self, key):
+        if not self.members[key]:
+            self.members[key] = True
+            self.count += 1
+            self.update(key, 1)
+
+    def discard(self, key):
+        if self.members[key]:
+            self.members[key] = False
+            self.count -= 1
+            self.update(key, -1)
+
+    def rank(self, key):
+        """Number of members lower than a key."""
+        key -= 1
+        total = 0
+        while key > 0:
+            total += self.tree[key]
+            key -= key & -key
+        return total
+
+    def kth(self, k):
+        """Member with k members lower than it."""
+        key = 0
+        step = self.top
+        while step:
+            if key + step <= self.size and self.tree[key + step] <= k:
+                key += step
+                k -= self.tree[key]
+            step >>= 1
+        return key + 1
+
+
+class ParkingManager:
+    def __init__(self, parking_spots, bucket_size=4, width=None, height=None):
+        # Parking spots by key, keys run from 1 to the number of spots
+        self.positions = {key: tuple(spot) for key, spot in parking_spots.items()}
+        size = max(self.positions, default=0)
+
+        # Spots without a car on them, spots no car is heading to, and both
+        self.vacant = SpotSet(size)
+        self.unreserved = SpotSet(size)
+        self.available = SpotSet(size)
+
+        # Vacant and unreserved spots, bucketed by cell area
+        self.bucket_size = bucket_size
+        self.buckets = {}
+        for key in self.positions:
+            self.buckets.setdefault(self.bucket_of(key), set()).add(key)
+        columns = [i for i, _ in self.buckets] or [0]
+        rows = [j for _, j in self.buckets] or [0]
+        self.bounds = (min(columns), max(columns), min(rows), max(rows))
+
+        # Size of the grid when it wraps around, in cells and in buckets. The
+        # last bucket of an axis is short when the size is not a multiple of
+        # the bucket size, and the cells across the edge are that much closer
+        self.width, self.height = width, height
+        if width is not None:
+            self.shape = (-(-width // bucket_size), -(-height // bucket_size))
+            self.shortfall = max(
+                self.shape[0] * bucket_size - width,
+                self.shape[1] * bucket_size - height,
+            )
+
+    @staticmethod
+    def ring(bx, by, radius):
+        """Buckets at a Chebyshev distance `radius` from a bucket."""
+        if radius == 0:
+            yield (bx, by)
+            return
+        for i in range(bx - radius, bx + radius + 1):
+            yield (i, by - radius)
+            yield (i, by + radius)
+        for j in range(by - radius + 1, by + radius):
+            yield (bx - radius, j)
+            yield (bx + radius, j)
+
+    def bucket_of(self, key):
+        x, y = self.positions[key]
+        return (x // self.bucket_size, y // self.bucket_size)
+
+    def is_available(self, key):
+        """Check if a spot is neither occupied nor reserved."""
+        return key in self.vacant and key in self.unreserved
+
+    def refresh_bucket(self, key):
+        bucket = self.buckets.setdefault(self.bucket_of(key), set())
+        if self.is_available(key):
+            bucket.add(key)
+            self.available.add(key)
+        else:
+            bucket.discard(key)
+            self.available.discard(key)
+
+    def occupy(self, key):
+        """Mark a spot as holding a car."""
+        self.vacant.discard(key)
+        self.refresh_bucket(key)
+
+    def vacate(self, key):
+        """Mark a spot as left by its car."""
+        self.vacant.add(key)
+        self.refresh_bucket(key)
+
+    def reserve(self, key):
+        """Mark a spot as the target of a car."""
+        self.unreserved.discard(key)
+        self.refresh_bucket(key)
+
+    def unreserve(self, key):
+        """Release the reservation of a spot."""
+        self.unreserved.add(key)
+        self.refresh_bucket(key)
+
+    def arrive(self, key):
+        """A car parks on the spot it reserved."""
+        self.unreserve(key)
+        self.occupy(key)
+
+    def depart(self, key):
+        """A car leaves the spot it was parked on."""
+        self.vacate(key)
+
+    def random_spot(self, spots, rng, exclude=None):
+        """Draw a spot of a SpotSet, skipping `exclude`, None when there is none."""
+        count = len(spots)
+        skip = exclude is not None and exclude in spots
+        if skip:
+            count -= 1
+        if count <= 0:
+            return None
+        k = rng.randrange(count)
+        if skip and spots.rank(exclude) <= k:
+            k += 1
+        return spots.kth(k)
+
+    def random_vacant(self, rng, exclude=None):
+        """Draw a spot without a car on it."""
+        return self.random_spot(self.vacant, rng, exclude)
+
+    def random_unreserved(self, rng, exclude=None):
+        """Draw a spot no car is heading to."""
+        return self.random_spot(self.unreserved, rng, exclude)
+
+    def random_available(self, rng, exclude=None):
+        """Draw a spot neither occupied nor reserved."""
+        return self.random_spot(self.available, rng, exclude)
+
+    def distance(self, key, x, y):
+        """Manhattan distance from a cell to a spot, across the edges on a torus."""
+        sx, sy = self.positions[key]
+        dx, dy = abs(sx - x), abs(sy - y)
+        if self.width is not None:
+            dx, dy = min(dx, self.width - dx), min(dy, self.height - dy)
+        return dx + dy
+
+    def nearest_available(self, pos, exclude=None):
+        """Find the available spot closest to a cell, by Manhattan distance.
+
+        Rings of buckets are searched outwards until no closer spot can
+        be found in the next ring. On a torus the rings wrap around the
+        edges, and a bucket reached twice is searched once. Returns None
+        when no spot is available.
+        """
+        x, y = pos
+        bx, by = x // self.bucket_size, y // self.bucket_size
+        if self.width is None:
+            min_i, max_i, min_j, max_j = self.bounds
+            reach = max(bx - min_i, max_i - bx, by - min_j, max_j - by)
+            shortfall = 0
+        else:
+            columns, rows = self.shape
+            reach = max(columns, rows) // 2
+            shortfall = self.shortfall
+            searched = set()
+
+        best, best_distance = None, None
+        for radius in range(reach + 1):
+            # Cells of this ring are farther than (radius - 1) buckets away
+            bound = (radius - 1) * self.bucket_size - shortfall
+            if best is not None and best_distance <= bound:
+                break
+            for bucket in self.ring(bx, by, radius):
+                if self.width is not None:
+                    bucket = (bucket[0] % columns, bucket[1] % rows)
+                    if bucket in searched:
+                        continue
+                    searched.add(bucket)
+                for key in self.buckets.get(bucket, ()):
+                    if key == exclude:
+                        continue
+                    distance = self.distance(key, x, y)
+                    if best is None or (distance, key) < (best_distance, best):
+                        best, best_distance = key, distance
+        return best
@@ -0,0 +1,201 @@
+"""
+Road Network
+=============================================================
+Compiled representation of the city streets. Every cell stores the
+directions it allows as a bitmask in a single NumPy array, so the
+legal moves of a car are one array lookup instead of a dict scan.
+"""
+
+import numpy as np
+
+# Direction names in bit order, the first eight are the movement directions
+DIRECTIONS = (
+    "left",
+    "right",
+    "up",
+    "down",
+    "down_left",
+    "down_right",
+    "up_left",
+    "up_right",
+    "traffic_left",
+    "traffic_right",
+    "traffic_up",
+    "traffic_down",
+)
+MOVE_DIRECTIONS = DIRECTIONS[:8]
+DIRECTION_INDEX = {direction: i for i, direction in enumerate(DIRECTIONS)}
+DIRECTION_BITS = {direction: 1 << i for i, direction in enumerate(DIRECTIONS)}
+MOVE_MASK = (1 << len(MOVE_DIRECTIONS)) - 1
+
+# Successor offset (dx, dy) of every movement direction, in bit order
+DIRECTION_OFFSETS = np.array(
+    [(-1, 0), (1, 0), (0, 1), (0, -1), (-1, -1), (1, -1), (-1, 1), (1, 1)],
+    dtype=np.int64,
+)
+OFFSETS = {
+    direction: (int(dx), int(dy))
+    for direction, (dx, dy) in zip(MOVE_DIRECTIONS, DIRECTION_OFFSETS)
+}
+
+# Random walk weight of every movement direction, in bit order
+DIRECTION_WEIGHTS = np.array([1, 1, 1, 1, 0.1, 0.1, 0.1, 0.1])
+
+# Movement directions allowed by every possible 8-bit mask
+MASK_DIRECTIONS = tuple(
+    tuple(d for i, d in enumerate(MOVE_DIRECTIONS) if mask >> i & 1)
+    for mask in range(MOVE_MASK + 1)
+)
+
+
+class RoadNetwork:
+    def __init__(self, width, height, coords):
+        self.width = width
+        self.height = height
+        self.masks = np.zeros((width, height), dtype=np.uint16)
+
+        # Set the bit of each direction list, ignoring cells outside the grid
+        for direction in DIRECTIONS:
+            cells = coords.get(f"{direction}_coords")
+            if not cells:
+                continue
+            xs, ys = np.asarray(cells, dtype=np.int64).reshape(-1, 2).T
+            inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+            self.masks[xs[inside], ys[inside]] |= DIRECTION_BITS[direction]
+
+    @classmethod
+    def from_masks(cls, masks):
+        """Wrap an existing bitmask grid, such as the one of a compiled map."""
+        network = cls(masks.shape[0], masks.shape[1], {})
+        network.masks = masks
+        return network
+
+    def directions(self, pos):
+        """Get the movement directions allowed at a cell."""
+        return MASK_DIRECTIONS[self.masks[pos] & MOVE_MASK]
+
+    def cell_directions(self, pos):
+        """Get the allowed flag of every direction at a cell."""
+        mask = int(self.masks[pos])
+        return {d: bool(mask & DIRECTION_BITS[d]) for d in DIRECTIONS}
+
+    def is_allowed(self, pos, direction):
+        """Check if a direction is allowed at a cell."""
+        return bool(self.masks[pos] & DIRECTION_BITS[direction])
+
+    def set_direction(self, pos, direction, allowed):
+        """Allow or forbid a direction at a cell."""
+        if allowed:
+            self.masks[pos] |= DIRECTION_BITS[direction]
+        else:
+            self.masks[pos] &= ~np.uint16(DIRECTION_BITS[direction])
+
+    def successor(self, pos, direction):
+        """Get the cell reached from a cell by moving in a direction."""
+        dx, dy = OFFSETS[direction]
+        return ((pos[0] + dx) % self.width, (pos[1] + dy) % self.height)
+
+    def successors(self, xs, ys, direction_indices):
+        """Get the cells reached from arrays of cells and direction indices."""
+        offsets = DIRECTION_OFFSETS[direction_indices]
+        return (
+            (xs + offsets[..., 0]) % self.width,
+            (ys + offsets[..., 1]) % self.height,
+        )
+
+    def allowed(self, direction_index):
+        """Boolean grid of the cells that allow a direction."""
+        return (self.masks >> direction_index & 1).astype(bool)
+
+
+class MoveTable:
+    """Cumulative random walk weights of the legal moves of every cell.
+
+    Moves into a parking spot are left out, except into the target of the
+    car, which gets its own rows at the cells leading into it. A move is
+    a single uniform sample searched in an 8-entry row.
+    """
+
+    def __init__(self, road_network, parking_spots, cumulative=None):
+        self.road_network = road_network
+        self.spots = [tuple(spot) for spot in parking_spots]
+        self.parking = np.zeros((road_network.width, road_network.height), dtype=bool)
+        if self.spots:
+            self.parking[tuple(np.array(self.spots).T)] = True
+
+        # (target spot, cell) -> cumulative row allowing the move into the target
+        self.target_cumulative = {}
+        if cumulative is None:
+            self.update()
+        else:
+            # Precomputed base table, such as the one of a compiled map
+            self.cumulative = cumulative
+            self.update_targets()
+
+    def update(self):
+        """Recompute the tables after the allowed directions changed."""
+        width, height = self.road_network.width, self.road_network.height
+        weights = np.zeros((width, height, len(MOVE_DIRECTIONS)))
+        for d, (dx, dy) in enumerate(DIRECTION_OFFSETS):
+            free = ~np.roll(self.parking, (-dx, -dy), axis=(0, 1))
+            weights[..., d] = self.road_network.allowed(d) * free * DIRECTION_WEIGHTS[d]
+        self.cumulative = np.cumsum(weights, axis=2)
+        self.update_targets()
+
+    def cell_weights(self, pos):
+        """Weights of the moves of a cell, with the parking spots left out."""
+        weights = np.zeros(len(MOVE_DIRECTIONS))
+        for d, direction in enumerate(MOVE_DIRECTIONS):
+            if (
+                self.road_network.masks[pos] >> d & 1
+                and not self.parking[self.road_network.successor(pos, direction)]
+            ):
+                weights[d] = DIRECTION_WEIGHTS[d]
+        return weights
+
+    def update_targets(self):
+        """Recompute the rows of the cells leading into each parking spot."""
+        weights = {}
+        width, height = self.road_network.width, self.road_network.height
+        for spot in self.spots:
+            for d, (dx, dy) in enumerate(DIRECTION_OFFSETS):
+                pos = ((spot[0] - dx) % width, (spot[1] - dy) % height)
+                if not self.road_network.masks[pos] >> d & 1:
+                    continue
+                if (spot, pos) not in weights:
+                    weights[(spot, pos)] = self.cell_weights(pos)
+                weights[(spot, pos)][d] = DIRECTION_WEIGHTS[d]
+
+        self.target_cumulative = {key: np.cumsum(row) for key, row in weights.items()}
+
+    def update_cell(self, pos):
+        """Recompute the rows of one cell after its allowed directions changed.
+
+        Only the row of the cell and its rows towards the spots next to it
+        depend on its directions, the rest of the tables stay as they are.
+        """
+        weights = self.cell_weights(pos)
+        self.cumulative[pos] = np.cumsum(weights)
+        rows = {}
+        for d, direction in enumerate(MOVE_DIRECTIONS):
+            spot = self.road_network.successor(pos, direction)
+            if not self.parking[spot]:
+                continue
+            self.target_cumulative.pop((spot, pos), None)
+            if self.road_network.masks[pos] >> d & 1:
+                rows.setdefault(spot, weights.copy())[d] = DIRECTION_WEIGHTS[d]
+        for spot, row in rows.items():
+            self.target_cumulative[(spot, pos)] = np.cumsum(row)
+
+    def choose(self, pos, target, sample):
+        """Pick a legal direction index at a cell from a uniform sample in [0, 1).
+
+        Returns -1 when the cell has no legal move.
+        """
+        row = self.target_cumulative.get((target, pos))
+        if row is None:
+            row = self.cumulative[pos]
+        total = row[-1]
+        if total <= 0:
+            return -1
+        return int(np.searchsorted(row, sample * total, side="right"))
@@ -0,0 +1,357 @@
+"""
+Routing Table
+=============================================================
+Shortest-path routing towards every parking spot of the city. A
+reverse breadth first search runs from all the spots at once over the
+directed road network, and stores for each (target, cell) pair the
+direction of the next hop, so a car decision is a single lookup. The
+search only expands the cells of its frontier, so building the tables
+takes O(targets x cells). Opening or closing a street only repairs the
+cells whose route it changes, instead of searching again.
+"""
+
+import numpy as np
+
+from RoadNetwork import DIRECTION_OFFSETS, MOVE_DIRECTIONS
+
+
+def distinct(values):
+    """Sorted distinct values of an integer array.
+
+    Sorting beats the hashing of np.unique on the small frontiers of
+    the route repairs.
+    """
+    values = np.sort(values)
+    keep = np.empty(values.size, dtype=bool)
+    keep[:1] = True
+    np.not_equal(values[1:], values[:-1], out=keep[1:])
+    return values[keep]
+
+
+class RoutingTable:
+    def __init__(self, road_network, parking_spots, tables=None):
+        self.road_network = road_network
+        # Parking spots ordered by their key, each spot gets one table row
+        self.keys = list(parking_spots.keys())
+        self.spots = [tuple(parking_spots[key]) for key in self.keys]
+        self.target_index = {spot: i for i, spot in enumerate(self.spots)}
+
+        shape = (len(self.spots), road_network.width, road_network.height)
+        self.parking = np.zeros(shape[1:], dtype=bool)
+        if self.spots:
+            self.parking[tuple(np.array(self.spots).T)] = True
+        # Flat cell index of the spot of each target row
+        self.target_cells = np.array(
+            [x * road_network.height + y for x, y in self.spots], dtype=np.int64
+        )
+        # Flat index of the cell reached from every cell in each direction,
+        # and of the cell that reaches it
+        self.successor_cells = self.neighbour_cells(1)
+        self.predecessor_cells = self.neighbour_cells(-1)
+
+        # Distance in steps and next hop direction index, -1 when unreachable,
+        # searched here unless precomputed tables are given
+        if tables is not None:
+            self.distances, self.next_hop = tables
+            return
+        self.distances = np.full(shape, -1, dtype=np.int32)
+        self.next_hop = np.full(shape, -1, dtype=np.int8)
+        self.update(range(len(self.spots)))
+
+    def update(self, targets):
+        """Recompute the routes towards the given target rows."""
+        targets = np.asarray(list(targets), dtype=np.int64)
+        if targets.size == 0:
+            return
+        distances, next_hop = self.search(targets)
+        self.distances[targets] = distances
+        self.next_hop[targets] = next_hop
+
+    def affected_targets(self, pos, direction, allowed):
+        """Get the target rows whose routes change when a cell direction toggles.
+
+        Closing it only breaks the routes whose next hop at the cell is that
+        direction. Opening it only changes the routes that get shorter by
+        going through its successor, or as short with a lower direction
+        index, and a car may only enter that successor if it is not a
+        parking spot or it is the target itself.
+        """
+        x, y = pos
+        if not allowed:
+            return np.flatnonzero(self.next_hop[:, x, y] == direction)
+
+        dx, dy = DIRECTION_OFFSETS[direction]
+        nx = (x + dx) % self.road_network.width
+        ny = (y + dy) % self.road_network.height
+        through = self.distances[:, nx, ny]
+        current = self.distances[:, x, y]
+        usable = through >= 0
+        if self.parking[nx, ny]:
+            usable &= np.arange(len(self.spots)) == self.target_index[(nx, ny)]
+        tie = (through + 1 == current) & (direction < self.next_hop[:, x, y])
+        return np.flatnonzero(usable & ((current < 0) | (through + 1 < current) | tie))
+
+    def toggle(self, pos, direction, allowed):
+        """Repair the routes after a cell direction was opened or closed.
+
+        Call it once the road network allows or forbids the direction.
+        The tables end up exactly as a full search would leave them, but
+        only the cells whose route goes through the toggled move are
+        visited: on a close the cells whose next hop chain passes it,
+        stopping at the ones with another route as short, on an open the
+        cells that get closer to the target through it.
+        """
+        height = self.road_network.height
+        cell = pos[0] * height + pos[1]
+        rows = self.affected_targets(pos, direction, allowed)
+        if rows.size == 0:
+            return
+        flat = rows * self.road_network.width * height + cell
+        if allowed:
+            self.shorten(flat, direction)
+            return
+
+        # A cell with another move as short only changes its next hop
+        next_hop = self.next_hop.reshape(-1)
+        next_hop[flat] = self.choose_next_hops(flat)
+        broken = flat[next_hop[flat] < 0]
+        if broken.size:
+            self.reroute(broken)
+
+    def split(self, flat):
+        """Target rows and flat cell indices of flat (row, cell) indices."""
+        return np.divmod(flat, self.road_network.width * self.road_network.height)
+
+    def passable(self, rows, cells):
+        """Whether routes of the rows may go on from the cells.
+
+        Only the target of a row may be entered among the parking spots.
+        """
+        return ~self.parking.reshape(-1)[cells] | (cells == self.target_cells[rows])
+
+    def choose_next_hops(self, flat):
+        """Lowest direction index leading one step closer to the target, -1 if none.
+
+        This is the move the full search picks for a cell, given the
+        distances of its successors.
+        """
+        distances = self.distances.reshape(-1)
+        rows, cells = self.split(flat)
+        base = flat - cells
+        masks = self.road_network.masks.reshape(-1)[cells]
+        wanted = distances[flat] - 1
+        hops = np.full(len(flat), -1, dtype=np.int8)
+        for d in range(len(DIRECTION_OFFSETS)):
+            successor = self.successor_cells[d][cells]
+            closer = (hops < 0) & (wanted >= 0) & (masks >> d & 1).astype(bool)
+            closer &= distances[base + successor] == wanted
+            closer &= self.passable(rows, successor)
+            hops[closer] = d
+        return hops
+
+    def predecessors_of(self, flat, unreached_only=False):
+        """Flat indices of the cells with a legal move onto the given cells."""
+        distances = self.distances.reshape(-1)
+        masks = self.road_network.masks.reshape(-1)
+        cells = flat % (self.road_network.width * self.road_network.height)
+        base = flat - cells
+        found = []
+        for d in range(len(DIRECTION_OFFSETS)):
+            predecessor = self.predecessor_cells[d][cells]
+            legal = (masks[predecessor] >> d & 1).astype(bool)
+            predecessor = base[legal] + predecessor[legal]
+            if unreached_only:
+                predecessor = predecessor[distances[predecessor] < 0]
+            found.append(predecessor)
+        return np.concatenate(found)
+
+    def shorten(self, flat, direction):
+        """Spread the distances a newly opened move shortened from its cells."""
+        distances = self.distances.reshape(-1)
+        cells = flat % (self.road_network.width * self.road_network.height)
+        through = distances[flat - cells + self.successor_cells[direction][cells]] + 1
+        improved = (distances[flat] < 0) | (through < distances[flat])
+        frontier = flat[improved]
+        distances[frontier] = through[improved]
+
+        # Every row only holds one level of its wave at a time
+        masks = self.road_network.masks.reshape(-1)
+        changed = [frontier]
+        while frontier.size:
+            rows, cells = self.split(frontier)
+            passable = self.passable(rows, cells)
+            frontier, cells = frontier[passable], cells[passable]
+            base = frontier - cells
+            level = distances[frontier] + 1
+            found, levels = [], []
+            for d in range(len(DIRECTION_OFFSETS)):
+                # Cells found twice in a row are at the same level
+                predecessor = self.predecessor_cells[d][cells]
+                closer = (masks[predecessor] >> d & 1).astype(bool)
+                predecessor = base + predecessor
+                current = distances[predecessor]
+                closer &= (current < 0) | (level < current)
+                found.append(predecessor[closer])
+                levels.append(level[closer])
+            frontier = np.concatenate(found)
+            distances[frontier] = np.concatenate(levels)
+            frontier = distinct(frontier)
+            changed.append(frontier)
+
+        # The cells next to a shortened one may prefer a move onto it
+        changed = np.concatenate(changed)
+        cells = distinct(np.concatenate([flat, changed, self.predecessors_of(changed)]))
+        self.next_hop.reshape(-1)[cells] = self.choose_next_hops(cells)
+
+    def reroute(self, roots):
+        """Search again the routes of the cells that can no longer keep their distance.
+
+        Starting from the roots, which lost their only shortest move, the
+        cells whose next hop leads into a lost cell are checked level by
+        level. A cell with another move as short keeps its distance and
+        only changes its next hop, the others are lost as well. The lost
+        cells are then reached again from the cells around them in order
+        of distance, so the search stays within the routes that got longer.
+        """
+        distances = self.distances.reshape(-1)
+        next_hop = self.next_hop.reshape(-1)
+
+        lost = [roots]
+        frontier = roots
+        distances[frontier] = -1
+        while frontier.size:
+            cells = frontier % (self.road_network.width * self.road_network.height)
+            base = frontier - cells
+            children = []
+            for d in range(len(DIRECTION_OFFSETS)):
+                predecessor = base + self.predecessor_cells[d][cells]
+                children.append(predecessor[next_hop[predecessor] == d])
+            children = np.concatenate(children)
+            # The lost parents are already out of the tables
+            next_hop[children] = self.choose_next_hops(children)
+            frontier = children[next_hop[children] < 0]
+            distances[frontier] = -1
+            lost.append(frontier)
+        lost = np.concatenate(lost)
+        next_hop[lost] = -1
+
+        # Shortest distance of each cell through the cells left in the tables
+        rows, cells = self.split(lost)
+        base = lost - cells
+        masks = self.road_network.masks.reshape(-1)[cells]
+        seeds = np.full(len(lost), -1, dtype=np.int64)
+        for d in range(len(DIRECTION_OFFSETS)):
+            successor = self.successor_cells[d][cells]
+            through = distances[base + successor] + 1
+            usable = (masks >> d & 1).astype(bool) & (through > 0)
+            usable &= self.passable(rows, successor)
+            usable &= (seeds < 0) | (through < seeds)
+            seeds[usable] = through[usable]
+        reached = seeds >= 0
+        order = np.argsort(seeds[reached], kind="stable")
+        starts, levels = lost[reached][order], seeds[reached][order]
+
+        # Breadth first search from the seeds, each joining at its own level
+        frontier = np.zeros(0, dtype=np.int64)
+        seeded = 0
+        level = levels[0] if levels.size else 0
+        while frontier.size or seeded < len(starts):
+            if not frontier.size:
+                level = max(level, levels[seeded])
+            joining = np.searchsorted(levels, level, side="right")
+            frontier = np.concatenate([frontier, starts[seeded:joining]])
+            seeded = joining
+            frontier = distinct(frontier[distances[frontier] < 0])
+            distances[frontier] = level
+            rows, cells = self.split(frontier)
+            frontier = self.predecessors_of(frontier[self.passable(rows, cells)], True)
+            level += 1
+
+        next_hop[lost] = self.choose_next_hops(lost)
+
+    def predecessors(self):
+        """Flat index of the cell that reaches each cell in every direction.
+
+        Returns one array per direction, and the grid of the cells that
+        allow it, both flattened.
+        """
+        return [
+            (self.predecessor_cells[d], self.road_network.allowed(d).ravel())
+            for d in range(len(DIRECTION_OFFSETS))
+        ]
+
+    def neighbour_cells(self, sign):
+        """Flat index of the successor of every cell in each direction.
+
+        With sign -1, the flat index of the cell each cell is the
+        successor of instead.
+        """
+        width, height = self.road_network.width, self.road_network.height
+        xs, ys = np.divmod(np.arange(width * height), height)
+        return np.stack(
+            [
+                ((xs + sign * dx) % width) * height + (ys + sign * dy) % height
+                for dx, dy in DIRECTION_OFFSETS
+            ]
+        )
+
+    def search(self, targets):
+        """Run the reverse breadth first search from the given target rows.
+
+        Each target is its own layer of a flat (target, cell) index, and
+        every level of the search expands the frontier of all of them at
+        once. A cell takes the lowest direction index among the moves
+        leading onto the frontier. Cars may only enter their own parking
+        spot, so other spots get a route out of them but never pass one on.
+        """
+        width, height = self.road_network.width, self.road_network.height
+        size = width * height
+        shape = (len(targets), width, height)
+        xs, ys = np.array([self.spots[t] for t in targets]).reshape(-1, 2).T
+
+        distances = np.full(len(targets) * size, -1, dtype=np.int32)
+        next_hop = np.full(len(targets) * size, -1, dtype=np.int8)
+        frontier = np.arange(len(targets), dtype=np.int64) * size + xs * height + ys
+        distances[frontier] = 0
+
+        parking = self.parking.ravel()
+        predecessors = self.predecessors()
+        level = 0
+        while frontier.size:
+            level += 1
+            layers, cells = np.divmod(frontier, size)
+            found, directions = [], []
+            for d, (predecessor, allowed) in enumerate(predecessors):
+                # The cells whose successor in d is on the frontier
+                cell = predecessor[cells]
+                legal = allowed[cell]
+                found.append(layers[legal] * size + cell[legal])
+                directions.append(np.full(found[-1].size, d, dtype=np.int8))
+            found = np.concatenate(found)
+            directions = np.concatenate(directions)
+            fresh = distances[found] < 0
+            # Directions were appended in order, keep the first one of a cell
+            found, first = np.unique(found[fresh], return_index=True)
+            distances[found] = level
+            next_hop[found] = directions[fresh][first]
+            frontier = found[~parking[found % size]]
+
+        return distances.reshape(shape), next_hop.reshape(shape)
+
+    def next_direction(self, pos, target):
+        """Get the direction of the next hop from a cell towards a target spot."""
+        index = self.target_index.get(target)
+        if index is None:
+            return None
+        direction = self.next_hop[index, pos[0], pos[1]]
+        if direction < 0:
+            return None
+        return MOVE_DIRECTIONS[direction]
+
+    def distance(self, pos, target):
+        """Get the number of steps from a cell to a target spot, None if unreachable."""
+        index = self.target_index.get(target)
+        if index is None:
+            return None
+        distance = self.distances[index, pos[0], pos[1]]
+        return None if distance < 0 else int(distance)
@@ -0,0 +1,325 @@
+"""
+Session Pool
+=============================================================
+Session scoped simulations spread over a pool of worker processes.
+Each session owns a TrafficModel stepped by its own SimulationRunner
+inside one of the workers, so the sessions run on all the cores. The
+pool evicts the least recently used sessions above a session cap, and
+a background thread evicts the sessions left idle for too long. A
+worker whose process died is replaced by a fresh one, and its sessions
+are dropped.
+
+Every map is compiled once by the parent process into a file that the
+workers memory map, so the static grids and routing tables of all the
+sessions on a map share the same pages and no worker recomputes them.
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from SimulationRunner import SimulationRunner
+from TrafficModel import TrafficModel
+from mapBuild.cityMaps import load_map
+from mapBuild.mapCompiler import EXTENSION, compile_map
+
+# Parameters a client may set when it creates a session
+SESSION_PARAMETERS = (
+    "num_agents",
+    "seed",
+    "map",
+    "engine",
+    "signal_controller",
+    "street_closures",
+    "spawn_rate",
+    "dwell_time",
+    "tick_rate",
+)
+
+
+def build_model(map="default", map_path=None, **kwargs):
+    """Build a TrafficModel on a named map, or on its compiled file if given."""
+    if map_path is not None:
+        return TrafficModel.from_map(map_path, **kwargs)
+    return TrafficModel(**load_map(map), **kwargs)
+
+
+class CompiledMaps:
+    """Named maps compiled on first use into a directory of files."""
+
+    def __init__(self, directory=None):
+        self.directory = directory or tempfile.mkdtemp(prefix="citymaps_")
+        self.owned = directory is None
+        self.paths = {}
+        self.lock = threading.Lock()
+
+    def path(self, name):
+        """Get the compiled file of a map, compiling it the first time."""
+        with self.lock:
+            if name not in self.paths:
+                path = os.path.join(self.directory, name + EXTENSION)
+                compile_map(load_map(name), path)
+                self.paths[name] = path
+            return self.paths[name]
+
+    def cleanup(self):
+        """Delete the compiled files, and the directory if it was created here."""
+        with self.lock:
+            if self.owned:
+                shutil.rmtree(self.directory, ignore_errors=True)
+            else:
+                for path in self.paths.values():
+                    os.remove(path)
+            self.paths.clear()
+
+
+def close_runner(runner):
+    """Stop the runner of a session and free its model."""
+    runner.stop()
+    runner.model.release()
+
+
+def run_command(runners, command, session_id, args):
+    """Run one command of a worker on the runners of its sessions."""
+    if command == "create":
+        params = dict(args)
+        tick_rate = params.pop("tick_rate", None)
+        runner = SimulationRunner(build_model(**params), tick_rate=tick_rate)
+        runner.start()
+        runners[session_id] = runner
+        return runner.latest().step
+    if command == "snapshot":
+        runner = runners[session_id]
+        return runner.latest() if args is None else runner.get(args)
+    if command == "next_after":
+        return runners[session_id].next_after(args, timeout=0)
+    if command == "close":
+        close_runner(runners.pop(session_id))
+        return None
+    if command == "shutdown":
+        for runner in runners.values():
+            close_runner(runner)
+        runners.clear()
+        return None
+    raise ValueError(f"Unknown command: {command}")
+
+
+def serve_sessions(connection):
+    """Command loop of a worker process, owns the runners of its sessions."""
+    # The commands run in their own frame, so the loop keeps no reference
+    # to the runner of a closed session
+    runners = {}
+    while True:
+        command, session_id, args = connection.recv()
+        try:
+            result = run_command(runners, command, session_id, args)
+        except KeyError:
+            connection.send(("missing", session_id))
+        except Exception as error:
+            connection.send(("error", f"{type(error).__name__}: {error}"))
+        else:
+            connection.send(("ok", result))
+            if command == "shutdown":
+                return
+
+
+class Worker:
+    def __init__(self, context):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=serve_sessions, args=(child_connection,), daemon=True
+        )
+        self.process.start()
+        self.lock = threading.Lock()
+        self.sessions = set()
+
+    def request(self, command, session_id=None, args=None):
+        """Send a command to the worker and wait for its answer."""
+        with self.lock:
+            self.connection.send((command, session_id, args))
+            status, result = self.connection.recv()
+        if status == "missing":
+            raise KeyError(result)
+        if status == "error":
+            raise RuntimeError(result)
+        return result
+
+
+class SessionPool:
+    def __init__(
+        self,
+        workers=None,
+        max_sessions=32,
+        idle_timeout=600,
+        tick_rate=10,
+        evict_interval=30,
+        collect_interval=10,
+    ):
+        # Spawned workers do not inherit the threads of the server process
+        self.context = multiprocessing.get_context("spawn")
+        self.workers = [Worker(self.context) for _ in range(workers or os.cpu_count())]
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        # Steps per second of the sessions that do not set their own
+        self.tick_rate = tick_rate
+        # Sessions run until evicted, so they only sample their data
+        self.collect_interval = collect_interval
+        self.maps = CompiledMaps()
+        # Session id -> (worker, last access time), least recently used first,
+        # the time is None while the session is being created
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+        # Close the idle sessions even while no session is being created
+        self.stopped = threading.Event()
+        self.evict_interval = evict_interval
+        self.evictor = threading.Thread(target=self.evict_idle, daemon=True)
+        self.evictor.start()
+
+    def create(self, params):
+        """Start a new session, returns its id."""
+        unknown = set(params) - set(SESSION_PARAMETERS)
+        if unknown:
+            raise ValueError(f"Unknown session parameters: {sorted(unknown)}")
+        # Workers load the file compiled here instead of building the map
+        args = {
+            "tick_rate": self.tick_rate,
+            **params,
+            "collect_interval": self.collect_interval,
+            "map_path": self.maps.path(params.get("map", "default")),
+        }
+
+        self.evict(reserve=1)
+        for worker in list(self.workers):
+            if not worker.process.is_alive():
+                self.replace(worker)
+        session_id = uuid.uuid4().hex
+        with self.lock:
+            worker = min(self.workers, key=lambda worker: len(worker.sessions))
+            worker.sessions.add(session_id)
+            self.sessions[session_id] = (worker, None)
+        try:
+            self.request(worker, "create", session_id, args)
+        except KeyError:
+            raise RuntimeError("The worker process stopped, session not created")
+        except Exception:
+            self.forget(session_id)
+            raise
+        # Built, the session may be evicted from now on
+        self.touch(session_id)
+        return session_id
+
+    def request(self, worker, command, session_id=None, args=None):
+        """Send a command to a worker, replacing the worker if its process died.
+
+        The sessions of a dead worker are lost, so the command raises a
+        KeyError like for any unknown session.
+        """
+        try:
+            return worker.request(command, session_id, args)
+        except (EOFError, OSError):
+            self.replace(worker)
+            raise KeyError(session_id)
+
+    def replace(self, worker):
+        """Swap a dead worker for a fresh process and drop its sessions."""
+        with self.lock:
+            if worker not in self.workers:
+                # Another thread replaced it already
+                return
+            self.workers[self.workers.index(worker)] = Worker(self.context)
+            for session_id in worker.sessions:
+                self.sessions.pop(session_id, None)
+            worker.sessions.clear()
+        worker.process.terminate()
+        worker.connection.close()
+
+    def touch(self, session_id):
+        """Mark a session as used, returns its worker."""
+        with self.lock:
+            if session_id not in self.sessions:
+                raise KeyError(session_id)
+            worker, _ = self.sessions[session_id]
+            self.sessions[session_id] = (worker, time.monotonic())
+            self.sessions.move_to_end(session_id)
+        return worker
+
+    def snapshot(self, session_id, step=None):
+        """Get the latest snapshot of a session, or the one of a buffered step."""
+        return self.request(self.touch(session_id), "snapshot", session_id, step)
+
+    def next_after(self, session_id, step):
+        """Get the snapshot following a step, None if it is not ready yet."""
+        return self.request(self.touch(session_id), "next_after", session_id, step)
+
+    def close(self, session_id):
+        """Stop a session and free its model."""
+        worker = self.forget(session_id)
+        if worker is not None:
+            try:
+                self.request(worker, "close", session_id)
+            except KeyError:
+                # Gone already, with its worker or by another close
+                pass
+
+    def forget(self, session_id):
+        with self.lock:
+            entry = self.sessions.pop(session_id, None)
+            if entry is None:
+                return None
+            worker, _ = entry
+            worker.sessions.discard(session_id)
+        return worker
+
+    def evict(self, reserve=0):
+        """Close the idle sessions and the least recently used above the cap.
+
+        `reserve` leaves room under the cap for sessions about to start.
+        """
+        now = time.monotonic()
+        with self.lock:
+            built = [
+                (session_id, last_used)
+                for session_id, (_, last_used) in self.sessions.items()
+                if last_used is not None
+            ]
+            expired = [
+                session_id
+                for session_id, last_used in built
+                if now - last_used > self.idle_timeout
+            ]
+            overflow = len(self.sessions) - len(expired) - self.max_sessions + reserve
+            if overflow > 0:
+                alive = [s for s, _ in built if s not in expired]
+                expired.extend(alive[:overflow])
+        for session_id in expired:
+            self.close(session_id)
+
+    def evict_idle(self):
+        """Evict the sessions every `evict_interval` seconds, until shutdown."""
+        while not self.stopped.wait(self.evict_interval):
+            self.evict()
+
+    def session_ids(self):
+        """Get the ids of the open sessions, least recently used first."""
+        with self.lock:
+            return list(self.sessions)
+
+    def shutdown(self):
+        """Stop every session and worker process."""
+        self.stopped.set()
+        self.evictor.join()
+        for worker in self.workers:
+            try:
+                worker.request("shutdown")
+            except (EOFError, OSError):
+                # The process died already
+                pass
+            worker.process.join()
+        self.sessions.clear()
+        self.maps.cleanup()
@@ -0,0 +1,100 @@
+"""
+Simulation Runner
+=============================================================
+Steps a TrafficModel on a background thread at a fixed tick rate, or
+as fast as possible, and publishes an immutable snapshot of every step
+into a ring buffer. Readers never touch the model, so any number of
+clients can follow the run without slowing it down or stepping it.
+"""
+
+import threading
+import time
+from collections import deque, namedtuple
+
+# State of the model after a step, never modified once published
+Snapshot = namedtuple("Snapshot", ["step", "global_map", "keyframe", "delta"])
+
+
+class SimulationRunner:
+    def __init__(self, model, tick_rate=None, history=256):
+        self.model = model
+        # Steps per second, None or 0 to run as fast as possible
+        self.tick_rate = tick_rate
+        self.snapshots = deque(maxlen=history)
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+        self.publish()
+
+    def publish(self):
+        """Store the current state of the model as the latest snapshot."""
+        snapshot = Snapshot(
+            step=self.model.steps,
+            global_map=self.model.get_global_map(),
+            keyframe=self.model.get_global_map_keyframe(),
+            delta=self.model.get_global_map(delta=True),
+        )
+        with self.condition:
+            self.snapshots.append(snapshot)
+            self.condition.notify_all()
+
+    def start(self):
+        """Start stepping the model in the background, if not running yet."""
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop the background loop and wait for the current step to finish."""
+        with self.condition:
+            self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        """Step the model and publish snapshots until stopped."""
+        next_tick = time.perf_counter()
+        while self.running:
+            self.model.step()
+            self.publish()
+            if self.tick_rate:
+                next_tick += 1 / self.tick_rate
+                delay = next_tick - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    # Running late, do not try to catch up with a burst of steps
+                    next_tick = time.perf_counter()
+
+    def latest(self):
+        """Get the most recent snapshot."""
+        with self.condition:
+            return self.snapshots[-1]
+
+    def get(self, step):
+        """Get the snapshot of a step, None if it is not in the buffer."""
+        with self.condition:
+            first = self.snapshots[0].step
+            if first <= step <= self.snapshots[-1].step:
+                return self.snapshots[step - first]
+        return None
+
+    def next_after(self, step, timeout=None):
+        """Wait for the snapshot following a step.
+
+        Returns the snapshot of step + 1, or the latest one when that step
+        already left the buffer, or None if nothing new came in time.
+        """
+        with self.condition:
+            if not self.condition.wait_for(
+                lambda: self.snapshots[-1].step > step, timeout
+            ):
+                return None
+            first = self.snapshots[0].step
+            if step + 1 >= first:
+                return self.snapshots[step + 1 - first]
+            return self.snapshots[-1]
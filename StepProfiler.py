@@ -0,0 +1,111 @@
+"""
+Step Profiler
+=============================================================
+Per-phase timing and event counters of TrafficModel.step. The model
+marks the end of every phase of its step, and the profiler adds the
+time since the previous mark to that phase. The cars and the traffic
+lights count their moves, blocks, retries and state changes. Everything
+is off by default, and while disabled every hook returns at once.
+"""
+
+import time
+
+# Phases of TrafficModel.step, in execution order
+PHASES = (
+    "count_traffic",
+    "street_closures",
+    "retire_cars",
+    "demand",
+    "cars",
+    "traffic_lights",
+    "collect",
+    "global_map",
+)
+
+# Event counters, with the help text of their metric
+COUNTERS = {
+    "moved": "Cars that moved to another cell",
+    "blocked_by_agent": "Moves blocked by another car on the next cell",
+    "blocked_by_semaphore": "Moves blocked by a red or idle traffic light",
+    "rejection_retries": "Directions rejected for leading into another parking spot",
+    "light_changes": "Traffic light state changes",
+}
+
+
+class StepProfiler:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        """Clear the accumulated times and counters."""
+        self.steps = 0
+        self.phase_ns = dict.fromkeys(PHASES, 0)
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.last = None
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        self.last = None
+
+    def start_step(self):
+        """Start timing a step, the first phase runs from here."""
+        if self.enabled:
+            self.steps += 1
+            self.last = time.perf_counter_ns()
+
+    def lap(self, phase):
+        """Charge the time since the previous mark to a phase."""
+        if self.enabled and self.last is not None:
+            now = time.perf_counter_ns()
+            self.phase_ns[phase] += now - self.last
+            self.last = now
+
+    def count(self, counter, amount=1):
+        """Add to an event counter."""
+        if self.enabled:
+            self.counters[counter] += amount
+
+    def report(self):
+        """Get the times and counters accumulated since the last reset."""
+        total = sum(self.phase_ns.values())
+        return {
+            "enabled": self.enabled,
+            "steps": self.steps,
+            "step_seconds": total / 1e9,
+            "phases": {
+                phase: {
+                    "seconds": ns / 1e9,
+                    "mean_ms": ns / 1e6 / self.steps if self.steps else 0.0,
+                    "share": ns / total if total else 0.0,
+                }
+                for phase, ns in self.phase_ns.items()
+            },
+            "counters": dict(self.counters),
+        }
+
+    def prometheus(self, prefix="traffic_model"):
+        """Format the times and counters in the Prometheus text format."""
+        lines = [
+            f"# HELP {prefix}_profiler_enabled Whether the step profiler is on",
+            f"# TYPE {prefix}_profiler_enabled gauge",
+            f"{prefix}_profiler_enabled {int(self.enabled)}",
+            f"# HELP {prefix}_profiled_steps_total Steps timed by the profiler",
+            f"# TYPE {prefix}_profiled_steps_total counter",
+            f"{prefix}_profiled_steps_total {self.steps}",
+            f"# HELP {prefix}_step_phase_seconds_total Time spent in each step phase",
+            f"# TYPE {prefix}_step_phase_seconds_total counter",
+        ]
+        for phase, ns in self.phase_ns.items():
+            lines.append(
+                f'{prefix}_step_phase_seconds_total{{phase="{phase}"}} {ns / 1e9:.9f}'
+            )
+        for counter, help_text in COUNTERS.items():
+            name = f"{prefix}_{counter}_total"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {self.counters[counter]}")
+        return "\n".join(lines) + "\n"
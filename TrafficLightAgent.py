@@ -1,19 +1,46 @@
 import mesa
-from CarAgent import CarAgent
+
+
+class SignalGroup:
+    """Grupo de semáforos con el mismo id, que cambian juntos."""
+
+    def __init__(self, group_id, monitored_positions):
+        self.group_id = group_id
+        self.monitored_positions = monitored_positions
+        self.lights = []
+        # Grupos opuestos por id, vecinos de alguno de los semáforos del grupo
+        self.opposites = {}
 
 
 class TrafficLightAgent(mesa.Agent):
     def __init__(self, unique_id, state, model, monitored_positions):
         super().__init__(model)
         self.unique_id = unique_id
-        self.state = state
+        self._state = state
         self.time_counter = 0
         self.monitored_positions = monitored_positions
         self.neighbor_siblings = []
         self.neighbor_opposites = []
+        self.group = None
+
+    @property
+    def state(self):
+        return self._state
+
+    @state.setter
+    def state(self, state):
+        # Record the change so the model can send it in the global map delta
+        if state != self._state:
+            self._state = state
+            self.model.dirty_traffic_lights.add(self)
+            self.model.profiler.count("light_changes")
 
     def update_neighbors(self):
-        """Actualiza las listas de semáforos hermanos y opuestos."""
+        """Actualiza las listas de semáforos hermanos y opuestos.
+
+        Los semáforos no se mueven, así que el modelo lo llama una sola vez
+        al colocarlos.
+        """
         neighbors = self.model.grid.get_neighbors(
             self.pos, moore=True, include_center=False
         )
@@ -31,76 +58,18 @@ class TrafficLightAgent(mesa.Agent):
             and agent.unique_id != self.unique_id
         ]
 
-    def change_state(self, state):
-        """Cambia el estado del semáforo automáticamente."""
-        self.state = state
-
     def cars_in_monitored_area(self):
-        """Revisa si hay autos en las posiciones monitoreadas."""
-        in_area_cars = 0
-        for pos in self.monitored_positions:
-            agents = self.model.grid.get_cell_list_contents([pos])
-            for agent in agents:
-                if isinstance(agent, CarAgent):
-                    in_area_cars += 1
-        return in_area_cars
-
-    def compare_traffic_with_neighbors(self):
-        """Compara el tráfico en su área monitoreada con los vecinos y ajusta estados."""
-        current_traffic = self.cars_in_monitored_area()
+        """Cuenta los autos en las posiciones monitoreadas.
 
-        for sibling in self.neighbor_siblings:
-            sibling_traffic = sibling.cars_in_monitored_area()
-
-        for opposite in self.neighbor_opposites:
-            opposite_traffic = opposite.cars_in_monitored_area()
-
-        # Cambiar el estado basado en el tráfico
-        if current_traffic == 0:
-            self.change_state(3)
-            for sibling in self.neighbor_siblings:
-                sibling.change_state(3)
-            return
-
-        tempSelf = None
-        for opposite in self.neighbor_opposites:
-            opposite_traffic = opposite.cars_in_monitored_area()
-            if current_traffic > opposite_traffic:
-                self.state = 2
-                if opposite_traffic == 0:
-                    opposite_traffic = 3
-                else:
-                    opposite.state = 1
-
-                tempSelf = opposite
-                for sibling in self.neighbor_siblings:
-                    sibling.state = self.state
-            elif current_traffic == opposite_traffic:
-                self.state = 2
-                opposite.state = 1
-                tempSelf = opposite
-                for sibling in self.neighbor_siblings:
-                    sibling.state = self.state
-
-        # Obtener vecinos de tempSelf
-        if tempSelf:
-            tempSelf_neighbors = self.model.grid.get_neighbors(
-                tempSelf.pos, moore=True, include_center=False
-            )
-            tempSelf_traffic_lights = [
-                agent
-                for agent in tempSelf_neighbors
-                if isinstance(agent, TrafficLightAgent)
-            ]
-
-            for neighbor in tempSelf_traffic_lights:
-                neighbor_traffic = neighbor.cars_in_monitored_area()
-
-                if tempSelf.unique_id == neighbor.unique_id:
-                    neighbor.state = tempSelf.state
+        Lee el conteo del paso que el modelo calcula una sola vez para todos
+        los semáforos.
+        """
+        return self.model.traffic_counter.count(("signal", self.unique_id))
 
     def step(self):
-        """Actualizar el estado en cada paso."""
+        """Actualizar el contador en cada paso.
+
+        El estado lo decide el controlador de semáforos del modelo, para
+        todos los semáforos a la vez.
+        """
         self.time_counter += 1
-        self.update_neighbors()  # Asegurarse de que las listas de vecinos estén actualizadas.
-        self.compare_traffic_with_neighbors()
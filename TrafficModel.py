@@ -5,15 +5,31 @@ A Mesa implementation of a city simulation model, where the cars
 move randomly around the city and go to the parking spots in there.
 """
 
+import logging
 import mesa
 import time
+from collections import deque
 import seaborn as sns
-import random
 import numpy as np
 import pandas as pd
 
 from CarAgent import CarAgent
-from TrafficLightAgent import TrafficLightAgent
+from ColumnarCollector import ColumnarCollector
+from DemandGenerator import DemandGenerator
+from ParkingManager import ParkingManager
+from RoadNetwork import DIRECTION_INDEX, MOVE_DIRECTIONS, MoveTable, RoadNetwork
+from RoutingTable import RoutingTable
+from StepProfiler import StepProfiler
+from TrafficCounter import TrafficCounter
+from TrafficLightAgent import SignalGroup, TrafficLightAgent
+from TrafficSignalController import controllers
+from VectorizedEngine import VectorizedEngine
+from mapBuild.mapCompiler import load_compiled_map
+
+logger = logging.getLogger(__name__)
+
+# Cars in a monitoring zone above which its street is closed
+CONGESTION_THRESHOLD = 10
 
 
 class TrafficModel(mesa.Model):
@@ -26,12 +42,25 @@ class TrafficModel(mesa.Model):
         buildings_coords=None,
         parking_coords=None,
         traffic_light_coords=None,
+        engine="agents",
+        signal_controller="greedy",
+        street_closures=False,
+        spawn_rate=0.0,
+        dwell_time=None,
+        collect_interval=1,
+        collect_path=None,
+        compiled_map=None,
+        profile=False,
+        seed=None,
     ):
-        super().__init__()
-        # Initialize random number generator and step counter
-        self.random = random.Random()
+        # Initialize the seeded random number generator and step counter
+        super().__init__(seed=seed)
         self.steps = 0
 
+        # Derive the NumPy generator from the same seeded stream, so a single
+        # seed reproduces the whole run
+        self.rng = np.random.default_rng(self.random.getrandbits(128))
+
         # Model parameters
         self.width = width
         self.height = height
@@ -40,12 +69,35 @@ class TrafficModel(mesa.Model):
         self.buildings_coords = buildings_coords
         self.parkings_coords = parking_coords
         self.traffic_light_coords = traffic_light_coords
-
-        # Dictionary to store directions for each cell
-        self.directions = {}
+        # Precompiled road network and routing tables, see from_map
+        self.compiled_map = compiled_map
+        # Timing of the step phases and counts of the car and light events
+        self.profiler = StepProfiler(enabled=profile)
 
         # Global map to store the positions of all agents at each step
         self.global_map = {}
+        self.global_map_step = None
+        self.global_map_delta = {
+            "Cars": [],
+            "Parked": [],
+            "Removed": [],
+            "Traffic_Lights": {},
+        }
+
+        # Registry of the cars by unique id, and agents changed during the step
+        self.cars = {}
+        self.dirty_cars = set()
+        self.dirty_traffic_lights = set()
+        self.removed_cars = []
+
+        # Cars still driving, the only ones stepped by the schedule
+        self.moving_cars = mesa.agent.AgentSet([], random=self.random)
+
+        # Parked cars leave the grid after `dwell_time` steps, None to stay, and
+        # their objects wait in the pool for a new trip
+        self.dwell_time = dwell_time
+        self.retiring = deque()
+        self.car_pool = []
 
         # Create a dictionary mapping each parking spot to a unique key starting from 1
         self.ParkingSpots = {i + 1: spot for i, spot in enumerate(parking_coords)}
@@ -53,27 +105,70 @@ class TrafficModel(mesa.Model):
         # Initialize grid layers
         self.initialize_layers()
 
+        # Index the parking spots by cell and track their occupancy
+        self.initialize_parking_index()
+        self.parking_manager = ParkingManager(
+            self.ParkingSpots, width=self.width, height=self.height
+        )
+
+        # Initialize the car and traffic light index arrays
+        self.initialize_occupancy()
+
         # Initialize the allowed directions for each cell
         self.initialize_directions(self.coords)
 
+        # Precompute the shortest routes towards every parking spot
+        self.initialize_routing()
+
+        # Select how the cars are stepped: one agent at a time or in batch
+        if engine == "agents":
+            self.engine = None
+        elif engine == "vectorized":
+            self.engine = VectorizedEngine(self)
+        else:
+            raise ValueError(f"Unknown engine: {engine}")
+
         # Create the CarAgents and place them on the grid
         self.create_CarAgents()
 
+        # Start new trips while the model runs
+        self.demand = DemandGenerator(self, spawn_rate)
+
         # Place the traffic lights on the grid
         self.place_TrafficLight_agents()
 
-        # Initialize the DataCollector
-        self.datacollector = mesa.DataCollector(
-            model_reporters={},
-            agent_reporters={
-                "TargetParkingSpot": lambda agent: (
-                    agent.target_parking_spot if isinstance(agent, CarAgent) else None
-                )
-            },
+        # Precompute the monitored cells counted at every step
+        self.initialize_traffic_counter()
+
+        # Precompute the streets closed when their monitoring zone is congested
+        self.street_closures = street_closures
+        self.initialize_street_closures()
+
+        # Select the policy deciding the state of the traffic lights, by name
+        # or as a SignalController class built on the model
+        if isinstance(signal_controller, str):
+            if signal_controller not in controllers:
+                raise ValueError(f"Unknown signal controller: {signal_controller}")
+            signal_controller = controllers[signal_controller]
+        self.signal_controller = signal_controller(self)
+
+        # Initialize the columnar data collector, spilling to `collect_path`
+        self.datacollector = ColumnarCollector(
+            self, interval=collect_interval, path=collect_path
         )
 
         # Collect initial data
-        self.datacollector.collect(self)
+        self.datacollector.collect()
+
+        # The initial global map holds every agent, so no change is pending
+        self.dirty_cars.clear()
+        self.dirty_traffic_lights.clear()
+
+    # Build a model on a map compiled by mapBuild.mapCompiler
+    @classmethod
+    def from_map(cls, path, **kwargs):
+        compiled_map = load_compiled_map(path)
+        return cls(**compiled_map.model_kwargs(), compiled_map=compiled_map, **kwargs)
 
     # Initialize the grid layers for buildings, parking spots, and traffic monitoring
     def initialize_layers(self):
@@ -87,9 +182,15 @@ class TrafficModel(mesa.Model):
             "traffic_monitoring", self.width, self.height, np.int64(0), np.int64
         )
 
-        self.set_building_cells(buildingLayer)
-        self.set_parking_cells(parkingsLayer)
-        self.set_traffic_monitoring_cells(trafficMonitoringLayer)
+        if self.compiled_map is not None:
+            # Views of the compiled map, shared with every model loading it
+            buildingLayer.data = self.compiled_map.arrays["building_layer"]
+            parkingsLayer.data = self.compiled_map.arrays["parking_layer"]
+            trafficMonitoringLayer.data = self.compiled_map.arrays["monitoring_layer"]
+        else:
+            self.set_building_cells(buildingLayer)
+            self.set_parking_cells(parkingsLayer)
+            self.set_traffic_monitoring_cells(trafficMonitoringLayer)
 
         self.grid = mesa.space.MultiGrid(
             self.width,
@@ -98,115 +199,123 @@ class TrafficModel(mesa.Model):
             (buildingLayer, parkingsLayer, trafficMonitoringLayer),
         )
 
-    # Initialize allowed directions for each cell in the grid
+    # Key of the parking spot in each cell, 0 when the cell is not a spot
+    def initialize_parking_index(self):
+        if self.compiled_map is not None:
+            self.parking_id = self.compiled_map.arrays["parking_id"]
+            return
+        self.parking_id = np.zeros((self.width, self.height), dtype=np.int32)
+        if self.ParkingSpots:
+            xs, ys = np.array(list(self.ParkingSpots.values())).T
+            self.parking_id[xs, ys] = list(self.ParkingSpots)
+
+    # Initialize the arrays indexing the cars and traffic lights of each cell
+    def initialize_occupancy(self):
+        # Unique id of the car in each cell, 0 when the cell is free
+        self.car_grid = np.zeros((self.width, self.height), dtype=np.int32)
+        # Index in self.traffic_lights of the light in each cell, -1 if none
+        self.traffic_light_grid = np.full((self.width, self.height), -1, dtype=np.int32)
+        self.traffic_lights = []
+
+    # Compile the allowed directions of every cell into the road network
     def initialize_directions(self, coords):
-        for x in range(self.width):
-            for y in range(self.height):
-                self.directions[(x, y)] = {
-                    "left": False,
-                    "right": False,
-                    "up": False,
-                    "down": False,
-                    "down_left": False,
-                    "down_right": False,
-                    "up_left": False,
-                    "up_right": False,
-                    "traffic_left": False,
-                    "traffic_right": False,
-                    "traffic_up": False,
-                    "traffic_down": False,
-                }
-
-        # Set specific directions for each list
-        for coord in coords["left_coords"]:
-            if coord in self.directions:
-                self.directions[coord]["left"] = True
-
-        for coord in coords["right_coords"]:
-            if coord in self.directions:
-                self.directions[coord]["right"] = True
-
-        for coord in coords["up_coords"]:
-            if coord in self.directions:
-                self.directions[coord]["up"] = True
-
-        for coord in coords["down_coords"]:
-            if coord in self.directions:
-                self.directions[coord]["down"] = True
-
-        for coord in coords["down_left_coords"]:
-            if coord in self.directions:
-                self.directions[coord]["down_left"] = True
-
-        for coord in coords["down_right_coords"]:
-            if coord in self.directions:
-                self.directions[coord]["down_right"] = True
-
-        for coord in coords["up_left_coords"]:
-            if coord in self.directions:
-                self.directions[coord]["up_left"] = True
-
-        for coord in coords["up_right_coords"]:
-            if coord in self.directions:
-                self.directions[coord]["up_right"] = True
+        if self.compiled_map is not None:
+            self.road_network = RoadNetwork.from_masks(self.compiled_map.masks)
+        else:
+            self.road_network = RoadNetwork(self.width, self.height, coords)
+
+    # Build the next hop routing table towards every parking spot, and the
+    # random walk tables of the cars without a route
+    def initialize_routing(self):
+        tables = cumulative = None
+        if self.compiled_map is not None:
+            tables = (self.compiled_map.distances, self.compiled_map.next_hop)
+            cumulative = self.compiled_map.arrays["move_cumulative"]
+        self.routing = RoutingTable(self.road_network, self.ParkingSpots, tables)
+        self.move_table = MoveTable(self.road_network, self.parkings_coords, cumulative)
 
     # Create car agents without a target parking spot
     def create_CarAgents_no_target(self):
         number_of_cars = 50
-        all_coords = [(x, y) for x in range(self.width) for y in range(self.height)]
-        available_coords = [
-            coord
-            for coord in all_coords
-            if coord not in self.parkings_coords and coord not in self.buildings_coords
-        ]
+        free = (self.parking_id == 0) & (self.grid.properties["building"].data == 0)
+        available_coords = [(int(x), int(y)) for x, y in np.argwhere(free)]
 
         if len(available_coords) < number_of_cars:
             raise ValueError("Not enough available coordinates to place all cars.")
 
         for _ in range(number_of_cars):
-            spawn_position = random.choice(available_coords)
+            spawn_position = self.random.choice(available_coords)
             available_coords.remove(spawn_position)
             agent = CarAgent(self, spawn_position, None)
-            self.grid.place_agent(agent, spawn_position)
+            self.place_car(agent, spawn_position)
 
     # Create car agents and place them on the grid
     def create_CarAgents(self):
-        spawn_spots = list(self.ParkingSpots.values())  # Copy of available spawn spots
-        target_spots = list(
-            self.ParkingSpots.values()
-        )  # Copy of available target spots
-
         for i in range(self.num_agents):
-            # Check if there are available spawn spots
-            if not spawn_spots:
-                print("No available spawn spots left")
+            # Select a spawn spot without a car on it
+            spawn_id = self.parking_manager.random_vacant(self.random)
+            if spawn_id is None:
+                logger.warning("No available spawn spots left")
                 break
 
-            # Select a unique spawn spot
-            Spawn = random.choice(spawn_spots)
-            spawn_spots.remove(Spawn)  # Remove the spawn spot to avoid reuse
-
-            # Filter target spots, excluding the current spawn spot
-            possible_target_spots = [spot for spot in target_spots if spot != Spawn]
-
-            # Check if there are available target spots
-            if not possible_target_spots:
-                print("No available target spots left")
+            # Select a target spot no other car is heading to, other than the spawn
+            target_id = self.parking_manager.random_unreserved(
+                self.random, exclude=spawn_id
+            )
+            if target_id is None:
+                logger.warning("No available target spots left")
                 break
 
-            # Select a unique target spot
-            target_parking_spot = random.choice(possible_target_spots)
-            target_spots.remove(
-                target_parking_spot
-            )  # Remove the target spot to avoid reuse
-
-            print(f"Spawn: {Spawn}, Target: {target_parking_spot}")
-
-            # Create the agent with the assigned spots
-            agent = CarAgent(self, Spawn, target_parking_spot)
-
-            # Place the agent on the grid at its spawn position
-            self.grid.place_agent(agent, Spawn)
+            logger.debug(
+                "Spawn: %s, Target: %s",
+                self.ParkingSpots[spawn_id],
+                self.ParkingSpots[target_id],
+            )
+
+            # Create the agent with the assigned spots, at its spawn position
+            self.add_car(spawn_id, target_id)
+
+    # Start a trip between two parking spots, with a car from the pool if any
+    def add_car(self, spawn_id, target_id):
+        self.parking_manager.occupy(spawn_id)
+        self.parking_manager.reserve(target_id)
+        spawn = self.ParkingSpots[spawn_id]
+        target = self.ParkingSpots[target_id]
+
+        if self.car_pool:
+            agent = self.car_pool.pop()
+            agent.reuse(spawn, target)
+        else:
+            agent = CarAgent(self, spawn, target)
+        self.place_car(agent, spawn)
+        return agent
+
+    # Retire a parked car after its dwell time, None keeps it parked
+    def schedule_retirement(self, agent):
+        if self.dwell_time is not None:
+            self.retiring.append((self.steps + self.dwell_time, agent))
+
+    # Take the cars parked for longer than their dwell time off the grid
+    def retire_cars(self):
+        while self.retiring and self.retiring[0][0] <= self.steps:
+            _, agent = self.retiring.popleft()
+            self.remove_car(agent)
+
+    # Take a car off the grid and put its object back in the pool
+    def remove_car(self, agent):
+        spot = self.parking_id[agent.pos]
+        if spot:
+            self.parking_manager.depart(int(spot))
+        self.car_grid[agent.pos] = 0
+        self.grid.remove_agent(agent)
+        del self.cars[agent.unique_id]
+        self.moving_cars.discard(agent)
+        self.dirty_cars.discard(agent)
+        self.removed_cars.append(agent.unique_id)
+        if self.engine is not None:
+            self.engine.remove(agent)
+        agent.remove()
+        self.car_pool.append(agent)
 
     # Place traffic light agents on the grid
     def place_TrafficLight_agents(self):
@@ -230,37 +339,155 @@ class TrafficModel(mesa.Model):
                 )
 
                 # Place the agent on the grid
-                self.grid.place_agent(sema_agent, pos)
+                self.place_traffic_light(sema_agent, pos)
+
+        # Lights never move, so their neighbors are found only once
+        self.initialize_signal_topology()
+
+    # Group the traffic lights by id and link the groups facing each other
+    def initialize_signal_topology(self):
+        self.signal_groups = {}
+        for agent in self.traffic_lights:
+            if agent.unique_id not in self.signal_groups:
+                self.signal_groups[agent.unique_id] = SignalGroup(
+                    agent.unique_id, agent.monitored_positions
+                )
+            agent.group = self.signal_groups[agent.unique_id]
+            agent.group.lights.append(agent)
+
+        for agent in self.traffic_lights:
+            agent.update_neighbors()
+            for opposite in agent.neighbor_opposites:
+                agent.group.opposites[opposite.unique_id] = opposite.group
+
+    # Count the cars watched by every signal group and monitoring zone together
+    def initialize_traffic_counter(self):
+        areas = {
+            ("signal", group_id): group.monitored_positions
+            for group_id, group in self.signal_groups.items()
+        }
+        for key, zone in self.coords.get("monitoring_coords", {}).items():
+            areas[("zone", key)] = zone["area"]
+        self.traffic_counter = TrafficCounter(self, areas)
+
+    # Group the monitoring zones by the street direction they close
+    def initialize_street_closures(self):
+        zones = self.coords.get("monitoring_coords", {})
+        streets = {}
+        self.closure_zones = np.array(
+            [self.traffic_counter.index[("zone", key)] for key in zones],
+            dtype=np.int64,
+        )
+        self.closure_streets = np.array(
+            [
+                streets.setdefault(
+                    (tuple(zone["pos"]), DIRECTION_INDEX[zone["direction"]]),
+                    len(streets),
+                )
+                for zone in zones.values()
+            ],
+            dtype=np.int64,
+        )
+        # Cell and direction index of each street
+        self.streets = list(streets)
+        # Only the directions the map allows can be closed
+        self.closable_streets = np.array(
+            [
+                self.road_network.is_allowed(pos, MOVE_DIRECTIONS[direction])
+                for pos, direction in self.streets
+            ],
+            dtype=bool,
+        )
+        self.closed_streets = np.zeros(len(self.streets), dtype=bool)
+
+    # Place a car on the grid and record it in the car index
+    def place_car(self, agent, pos):
+        self.grid.place_agent(agent, pos)
+        self.car_grid[pos] = agent.unique_id
+        self.cars[agent.unique_id] = agent
+        self.dirty_cars.add(agent)
+        if agent.active:
+            self.moving_cars.add(agent)
+        if self.engine is not None:
+            self.engine.add(agent)
+
+    # Place a traffic light on the grid and record it in the light index
+    def place_traffic_light(self, agent, pos):
+        self.grid.place_agent(agent, pos)
+        self.traffic_light_grid[pos] = len(self.traffic_lights)
+        self.traffic_lights.append(agent)
 
     # Fetch the direction info for a specific cell
     def get_cell_directions(self, pos):
-        return self.directions.get(pos, None)
-
-    # Create a global map of the current state of the simulation
-    def get_global_map(self):
-        car_agents = []
-        traffic_lights = {}
+        if self.grid.out_of_bounds(pos):
+            return None
+        return self.road_network.cell_directions(pos)
 
-        self.global_map = {"Cars": [], "Traffic_Lights": {}}
+    # Fetch the movement directions allowed at a specific cell
+    def get_possible_directions(self, pos):
+        return self.road_network.directions(pos)
 
-        for contents, (x, y) in self.grid.coord_iter():
-            for agent in contents:
-                if isinstance(agent, CarAgent):
-                    car_agents.append(agent)
-                elif isinstance(agent, TrafficLightAgent):
-                    traffic_lights[f"sema_{agent.unique_id}"] = agent.state
+    # Fetch the next hop direction from a cell towards a target parking spot
+    def get_next_direction(self, pos, target_parking_spot):
+        return self.routing.next_direction(pos, target_parking_spot)
 
-        # Sort car agents by unique_id
-        car_agents.sort(key=lambda agent: agent.unique_id)
-
-        # Add sorted car agents to the global map
-        for agent in car_agents:
-            self.global_map["Cars"].append({"x": agent.pos[0], "y": agent.pos[1]})
-
-        # Add traffic lights to the global map
-        self.global_map["Traffic_Lights"] = traffic_lights
+    # Create a global map of the current state of the simulation
+    def get_global_map(self, delta=False):
+        if delta:
+            return self.global_map_delta
+
+        # The map only changes when the model steps
+        if self.global_map_step == self.steps:
+            return self.global_map
+
+        # Cars are registered in unique_id order
+        self.global_map = {
+            "Cars": [
+                {"x": agent.pos[0], "y": agent.pos[1]} for agent in self.cars.values()
+            ],
+            "Traffic_Lights": {
+                f"sema_{agent.unique_id}": agent.state for agent in self.traffic_lights
+            },
+        }
+        self.global_map_step = self.steps
         return self.global_map
 
+    # Create a full snapshot in the same form as the global map delta
+    def get_global_map_keyframe(self):
+        return {
+            "Step": self.steps,
+            "Cars": [
+                {"id": agent.unique_id, "x": agent.pos[0], "y": agent.pos[1]}
+                for agent in self.cars.values()
+            ],
+            "Parked": [
+                agent.unique_id for agent in self.cars.values() if not agent.active
+            ],
+            "Traffic_Lights": {
+                f"sema_{agent.unique_id}": agent.state for agent in self.traffic_lights
+            },
+        }
+
+    # Record the cars and traffic lights that changed during the step
+    def update_global_map_delta(self):
+        changed_cars = sorted(self.dirty_cars, key=lambda agent: agent.unique_id)
+        self.global_map_delta = {
+            "Step": self.steps,
+            "Cars": [
+                {"id": agent.unique_id, "x": agent.pos[0], "y": agent.pos[1]}
+                for agent in changed_cars
+            ],
+            "Parked": [agent.unique_id for agent in changed_cars if not agent.active],
+            "Removed": self.removed_cars,
+            "Traffic_Lights": {
+                f"sema_{agent.unique_id}": agent.state
+                for agent in self.dirty_traffic_lights
+            },
+        }
+        self.dirty_cars.clear()
+        self.dirty_traffic_lights.clear()
+        self.removed_cars = []
+
     # Set the value of cells to indicate buildings
     def set_building_cells(self, buildingLayer):
         for coord in self.buildings_coords:
@@ -281,32 +508,67 @@ class TrafficModel(mesa.Model):
         for coord in all_monitored_coords:
             trafficMonitoringLayer.set_cell(coord, 1)
 
-    # Check if there is traffic in a given area
-    def traffic_in_area(self, area):
-        count = 0
-        for pos in area:
-            for agent in self.grid.get_cell_list_contents(pos):
-                if isinstance(agent, CarAgent):
-                    count += 1
-        return count > 10
+    # Check if there is traffic in a monitoring zone
+    def traffic_in_area(self, key):
+        return self.traffic_counter.count(("zone", key)) > CONGESTION_THRESHOLD
 
-    # Modify street directions based on traffic
+    # Close the streets of the congested monitoring zones and reopen the others,
+    # repairing only the routes and moves of each changed street
     def modify_street_with_traffic(self):
-        for key, value in self.coords["monitoring_coords"].items():
-            pos = value["pos"]
-            area = value["area"]
-            direction = value["direction"]
-
-            if self.traffic_in_area(area):
-                self.directions[pos][direction] = False
-            else:
-                self.directions[pos][direction] = True
+        congested = (
+            self.traffic_counter.current()[self.closure_zones] > CONGESTION_THRESHOLD
+        )
+        closed = np.zeros(len(self.streets), dtype=bool)
+        np.logical_or.at(closed, self.closure_streets, congested)
+        closed &= self.closable_streets
+
+        for street in np.flatnonzero(closed != self.closed_streets):
+            pos, direction = self.streets[street]
+            allowed = not closed[street]
+            self.road_network.set_direction(pos, MOVE_DIRECTIONS[direction], allowed)
+            self.routing.toggle(pos, direction, allowed)
+            self.move_table.update_cell(pos)
+        self.closed_streets = closed
 
     # Execute one step of the model, shuffle agents, and collect data
     def step(self):
-        # Shuffle and execute the step method for all agents
-        self.agents.shuffle_do("step")
+        profiler = self.profiler
+        profiler.start_step()
+        # Count the monitored traffic once, before any agent acts
+        self.traffic_counter.refresh()
+        profiler.lap("count_traffic")
+        if self.street_closures:
+            self.modify_street_with_traffic()
+        profiler.lap("street_closures")
+        # Free the spots of the cars done parking, then start the new trips
+        self.retire_cars()
+        profiler.lap("retire_cars")
+        self.demand.step()
+        profiler.lap("demand")
+        if self.engine is not None:
+            # Move all the cars at once
+            self.engine.step()
+        else:
+            # Shuffle and execute the step method of the cars still driving
+            self.moving_cars.shuffle_do("step")
+        profiler.lap("cars")
+        # Decide the state of every traffic light at once
+        for light in self.traffic_lights:
+            light.step()
+        self.signal_controller.step()
+        profiler.lap("traffic_lights")
         # Collect data for the current step
-        self.datacollector.collect(self)
-        # Create a global map of the current state
+        self.datacollector.collect()
+        profiler.lap("collect")
+        # Create a global map of the current state and of its changes
         self.get_global_map()
+        self.update_global_map_delta()
+        profiler.lap("global_map")
+
+    # Let the model be garbage collected once the caller drops it. Mesa keeps
+    # every model referenced in Agent._ids, the counter of its unique ids, so
+    # a finished model stays in memory for the life of the process otherwise
+    def release(self):
+        self.datacollector.cleanup()
+        self.remove_all_agents()
+        mesa.Agent._ids.pop(self, None)
@@ -0,0 +1,183 @@
+"""
+Traffic Signal Controller
+=============================================================
+Policies deciding the state of every traffic light of a TrafficModel.
+A controller works on the signal groups, the lights sharing an id, and
+computes the state of all of them at once from the monitored traffic
+counts of the step, so the outcome does not depend on the order the
+agents are activated in. The lights of a group always share a state.
+
+States follow the traffic lights: 1 red, 2 green, 3 idle. Only a car
+standing on a green light may cross it.
+"""
+
+import numpy as np
+
+RED, GREEN, IDLE = 1, 2, 3
+
+
+class SignalController:
+    def __init__(self, model):
+        self.model = model
+        self.groups = [model.signal_groups[key] for key in sorted(model.signal_groups)]
+        self.group_ids = np.array([group.group_id for group in self.groups])
+        index = {group.group_id: i for i, group in enumerate(self.groups)}
+
+        # Position of the count of each group in the traffic counter
+        self.count_index = np.array(
+            [model.traffic_counter.index[("signal", key)] for key in self.group_ids],
+            dtype=np.int64,
+        )
+
+        # Directed edges between opposite groups, both ways
+        pairs = {
+            (i, index[opposite])
+            for i, group in enumerate(self.groups)
+            for opposite in group.opposites
+        }
+        edges = sorted(pairs | {(target, source) for source, target in pairs})
+        edges = np.array(edges, dtype=np.int64).reshape(-1, 2)
+        self.sources, self.targets = edges.T
+        self.has_opposites = np.zeros(len(self.groups), dtype=bool)
+        self.has_opposites[self.sources] = True
+
+        self.states = np.array(
+            [group.lights[0].state for group in self.groups], dtype=np.int64
+        )
+
+    def counts(self):
+        """Get the monitored traffic of every group for the current step."""
+        return self.model.traffic_counter.current()[self.count_index]
+
+    def step(self):
+        """Compute the states of every group and apply the changes to the lights."""
+        states = self.control(self.counts())
+        for i in np.flatnonzero(states != self.states):
+            for light in self.groups[i].lights:
+                light.state = int(states[i])
+        self.states = states
+
+    def control(self, counts):
+        """Get the new state of every group, as an array."""
+        raise NotImplementedError
+
+
+class GreedyController(SignalController):
+    """Give the green to the busiest group of every pair of opposite groups.
+
+    A group without traffic goes idle. A group with traffic turns red if
+    an opposite group has more traffic, or as much traffic and a lower
+    id, and green otherwise. Groups without opposites keep their state.
+    """
+
+    def control(self, counts):
+        sources, targets = self.sources, self.targets
+        beaten_by_target = (counts[targets] > counts[sources]) | (
+            (counts[targets] == counts[sources]) & (targets < sources)
+        )
+        beaten = np.zeros(len(self.groups), dtype=bool)
+        np.logical_or.at(beaten, sources, beaten_by_target)
+
+        states = np.where(self.has_opposites, GREEN, self.states)
+        states[beaten] = RED
+        states[counts == 0] = IDLE
+        return states
+
+
+def color_phases(num_groups, sources, targets):
+    """Split the groups into phases with no two opposite groups together.
+
+    Greedy coloring in group order, returns the phase of every group and
+    the connected component, the intersection, it belongs to.
+    """
+    neighbors = [[] for _ in range(num_groups)]
+    for source, target in zip(sources, targets):
+        neighbors[source].append(target)
+
+    phases = np.full(num_groups, -1, dtype=np.int64)
+    components = np.full(num_groups, -1, dtype=np.int64)
+    for start in range(num_groups):
+        if components[start] >= 0:
+            continue
+        components[start] = start
+        queue = [start]
+        while queue:
+            group = queue.pop(0)
+            taken = {phases[neighbor] for neighbor in neighbors[group]}
+            phases[group] = min(set(range(len(taken) + 1)) - taken)
+            for neighbor in neighbors[group]:
+                if components[neighbor] < 0:
+                    components[neighbor] = start
+                    queue.append(neighbor)
+
+    _, components = np.unique(components, return_inverse=True)
+    return phases, components
+
+
+class FixedTimeController(SignalController):
+    """Cycle through the phases of every intersection on a fixed timer.
+
+    Opposite groups never share a phase, each phase stays green for
+    `green_time` steps and the others are red meanwhile.
+    """
+
+    def __init__(self, model, green_time=10):
+        super().__init__(model)
+        self.green_time = green_time
+        self.phases, self.components = color_phases(
+            len(self.groups), self.sources, self.targets
+        )
+        # Number of phases of the intersection of every group
+        num_phases = np.zeros(self.components.max(initial=-1) + 1, dtype=np.int64)
+        np.maximum.at(num_phases, self.components, self.phases + 1)
+        self.num_phases = num_phases[self.components]
+        self.ticks = 0
+
+    def control(self, counts):
+        phase = (self.ticks // self.green_time) % self.num_phases
+        self.ticks += 1
+        return np.where(self.phases == phase, GREEN, RED)
+
+
+class MaxPressureController(SignalController):
+    """Give the green to the phase with the most waiting cars of every intersection.
+
+    The pressure of a phase is the monitored traffic of its groups. The
+    map does not tell where the cars go after a light, so the downstream
+    queues of the classic max-pressure rule are left out. A phase stays
+    green for at least `min_green` steps, and only a strictly higher
+    pressure takes the green from it.
+    """
+
+    def __init__(self, model, min_green=3):
+        super().__init__(model)
+        self.min_green = min_green
+        self.phases, self.components = color_phases(
+            len(self.groups), self.sources, self.targets
+        )
+        num_components = self.components.max(initial=-1) + 1
+        self.num_phases = self.phases.max(initial=-1) + 1
+        self.current = np.zeros(num_components, dtype=np.int64)
+        self.elapsed = np.zeros(num_components, dtype=np.int64)
+
+    def control(self, counts):
+        pressure = np.zeros((len(self.current), self.num_phases), dtype=np.int64)
+        np.add.at(pressure, (self.components, self.phases), counts)
+
+        best = pressure.argmax(axis=1)
+        rows = np.arange(len(self.current))
+        switch = (self.elapsed >= self.min_green) & (
+            pressure[rows, best] > pressure[rows, self.current]
+        )
+        self.current = np.where(switch, best, self.current)
+        self.elapsed = np.where(switch, 1, self.elapsed + 1)
+
+        return np.where(self.phases == self.current[self.components], GREEN, RED)
+
+
+# Signal controllers available to a TrafficModel, by name
+controllers = {
+    "greedy": GreedyController,
+    "fixed_time": FixedTimeController,
+    "max_pressure": MaxPressureController,
+}
@@ -0,0 +1,282 @@
+"""
+Vectorized Engine
+=============================================================
+Batch stepping engine that moves every car of a TrafficModel at once.
+The car state lives in NumPy arrays and the CarAgent objects are kept
+in sync as thin views, so the grid, the global map and the data
+collector keep working on them. Each car holds a slot of the arrays
+while it is on the grid, and retired cars give their slot back for the
+next car to reuse. Routed cars follow the next hop table and the cars
+without a target draw their random walk moves from the move table, all
+of them in the same batch.
+"""
+
+import numpy as np
+
+from TrafficSignalController import GREEN
+
+# Resolution state of each car that wants to move
+UNDECIDED, MOVED, BLOCKED = 0, 1, 2
+
+
+class VectorizedEngine:
+    def __init__(self, model):
+        self.model = model
+        # Car of each slot, None when the slot is free
+        self.cars = []
+        self.slots = {}
+        self.free_slots = []
+        # Number of slots ever used, the arrays may hold more
+        self.size = 0
+
+        # Traffic light index -> signal group index, built on the first step
+        self.light_groups = None
+
+        self.ids = np.zeros(0, dtype=np.int32)
+        self.positions = np.zeros((0, 2), dtype=np.int64)
+        self.spawns = np.zeros((0, 2), dtype=np.int64)
+        self.targets = np.zeros(0, dtype=np.int64)
+        self.active = np.zeros(0, dtype=bool)
+        self.present = np.zeros(0, dtype=bool)
+        self.distance_travelled = np.zeros(0, dtype=np.int64)
+
+        for agent in sorted(model.cars.values(), key=lambda agent: agent.unique_id):
+            self.add(agent)
+
+    def grow(self):
+        """Double the capacity of the arrays, adding free slots."""
+        capacity = len(self.cars)
+        extra = max(capacity, 1)
+        self.cars.extend([None] * extra)
+        self.ids = np.concatenate([self.ids, np.zeros(extra, np.int32)])
+        self.positions = np.concatenate(
+            [self.positions, np.zeros((extra, 2), np.int64)]
+        )
+        self.spawns = np.concatenate([self.spawns, np.zeros((extra, 2), np.int64)])
+        self.targets = np.concatenate([self.targets, np.full(extra, -1, np.int64)])
+        self.active = np.concatenate([self.active, np.zeros(extra, bool)])
+        self.present = np.concatenate([self.present, np.zeros(extra, bool)])
+        self.distance_travelled = np.concatenate(
+            [self.distance_travelled, np.zeros(extra, np.int64)]
+        )
+        # Lowest slots are taken first
+        self.free_slots.extend(range(capacity + extra - 1, capacity - 1, -1))
+
+    def add(self, agent):
+        """Give a slot to a car placed on the grid."""
+        if not self.free_slots:
+            self.grow()
+        i = self.free_slots.pop()
+        self.size = max(self.size, i + 1)
+        self.cars[i] = agent
+        self.slots[agent] = i
+        self.ids[i] = agent.unique_id
+        self.positions[i] = agent.pos
+        self.spawns[i] = agent.pos
+        self.targets[i] = self.model.routing.target_index.get(
+            agent.target_parking_spot, -1
+        )
+        self.active[i] = agent.active
+        self.present[i] = True
+        self.distance_travelled[i] = agent.distance_travelled
+
+    def remove(self, agent):
+        """Free the slot of a car taken off the grid."""
+        i = self.slots.pop(agent)
+        self.cars[i] = None
+        self.targets[i] = -1
+        self.active[i] = False
+        self.present[i] = False
+        self.free_slots.append(i)
+
+    def step(self):
+        """Execute one step of every car."""
+        self.park()
+        moved = self.move()
+        self.sync(moved)
+
+    def park(self):
+        """Deactivate the cars standing on a parking spot other than their spawn."""
+        xs, ys = self.positions.T
+        parked = (
+            self.active
+            & self.model.routing.parking[xs, ys]
+            & (self.positions != self.spawns).any(axis=1)
+            & (self.distance_travelled > 0)
+        )
+        self.active &= ~parked
+        for i in np.flatnonzero(parked):
+            self.cars[i].park()
+
+    def light_states(self):
+        """State of every traffic light, followed by a green for the cells without one."""
+        controller = self.model.signal_controller
+        if self.light_groups is None:
+            index = {group_id: i for i, group_id in enumerate(controller.group_ids)}
+            self.light_groups = np.array(
+                [index[light.group.group_id] for light in self.model.traffic_lights],
+                dtype=np.int64,
+            )
+        return np.append(controller.states[self.light_groups], GREEN)
+
+    def walk(self, walkers, xs, ys):
+        """Draw a random walk direction for each car without a target, -1 if stuck."""
+        rows = self.model.move_table.cumulative[xs[walkers], ys[walkers]]
+        totals = rows[:, -1]
+        samples = self.model.rng.random(len(walkers)) * totals
+        directions = (rows <= samples[:, None]).sum(axis=1)
+        return np.where(totals > 0, directions, -1)
+
+    def move(self):
+        """Move every active car one hop, returns the moved cars."""
+        model = self.model
+        xs, ys = self.positions.T
+        width, height = model.width, model.height
+
+        # Next hop of the cars that follow a route, -1 if they have none
+        routed = self.active & (self.targets >= 0)
+        directions = np.full(len(self.cars), -1, dtype=np.int64)
+        directions[routed] = model.routing.next_hop[
+            self.targets[routed], xs[routed], ys[routed]
+        ]
+        walkers = np.flatnonzero(self.active & (self.targets < 0))
+        directions[walkers] = self.walk(walkers, xs, ys)
+
+        # Cars on a red or idle light stay where they are
+        green = self.light_states()[model.traffic_light_grid[xs, ys]] == GREEN
+
+        candidates = np.flatnonzero((directions >= 0) & green)
+        new_xs, new_ys = model.road_network.successors(
+            xs[candidates], ys[candidates], directions[candidates]
+        )
+        destinations = new_xs * height + new_ys
+
+        # Car standing on each cell at the start of the step
+        cell_car = np.full(width * height, -1, dtype=np.int64)
+        present = np.flatnonzero(self.present)
+        cell_car[xs[present] * height + ys[present]] = present
+
+        status = self.resolve(candidates, destinations, cell_car)
+        moved = candidates[status == MOVED]
+        moved_to = destinations[status == MOVED]
+        if model.profiler.enabled:
+            model.profiler.count("moved", len(moved))
+            model.profiler.count("blocked_by_agent", int((status == BLOCKED).sum()))
+            model.profiler.count(
+                "blocked_by_semaphore", int(((directions >= 0) & ~green).sum())
+            )
+
+        # Apply the moves to the arrays and the occupancy index
+        left = model.parking_id[xs[moved], ys[moved]]
+        for spot in left[left > 0]:
+            model.parking_manager.depart(int(spot))
+        model.car_grid[xs[moved], ys[moved]] = 0
+        self.positions[moved, 0] = moved_to // height
+        self.positions[moved, 1] = moved_to % height
+        model.car_grid[moved_to // height, moved_to % height] = self.ids[moved]
+        entered = model.parking_id[moved_to // height, moved_to % height]
+        for spot in entered[entered > 0]:
+            model.parking_manager.occupy(int(spot))
+        self.distance_travelled[moved] += 1
+
+        # Cars whose target is out of reach fall back to the per-agent logic
+        for i in np.flatnonzero(routed & (directions < 0)):
+            self.step_agent(i)
+
+        return moved
+
+    def resolve(self, candidates, destinations, cell_car):
+        """Resolve the cars that want the same cell.
+
+        A random priority permutation replays the shuffled activation
+        order: a car gets a cell if it was free and it has the best
+        priority among the cars asking for it, or if the car standing on
+        it moved away earlier in that order. Cars waiting on each other
+        in a cycle stay blocked, as they would one after the other.
+
+        Most candidates queue behind a car that stays, so the chains of
+        cars waiting on each other are followed to their head first, by
+        pointer jumping, and every chain that ends on a staying car or in
+        a cycle is blocked at once. Only the chains headed by a car going
+        to a free cell are resolved one link at a time.
+        """
+        priority = np.zeros(len(self.cars), dtype=np.int64)
+        priority[: self.size] = self.model.rng.permutation(self.size)
+        ranks = priority[candidates]
+        status = np.full(len(candidates), UNDECIDED, dtype=np.int8)
+
+        # Position of each car among the candidates, -1 if it stays
+        candidate_of = np.full(len(self.cars), -1, dtype=np.int64)
+        candidate_of[candidates] = np.arange(len(candidates))
+        occupants = cell_car[destinations]
+        occupied = occupants >= 0
+        blockers = np.where(occupied, candidate_of[occupants], -1)
+        # A freed cell can only be taken by cars acting after its owner left
+        thresholds = np.where(occupied, priority[occupants], -1)
+
+        # Head of the chain of every candidate, or a car of its cycle
+        heads = np.where(blockers >= 0, blockers, np.arange(len(candidates)))
+        for _ in range(int(len(candidates)).bit_length()):
+            heads = heads[heads]
+        status[occupied[heads] | (blockers[heads] >= 0)] = BLOCKED
+
+        best = np.full(len(cell_car), len(self.cars), dtype=np.int64)
+        pending = np.flatnonzero(status == UNDECIDED)
+        while len(pending):
+            waiting = blockers[pending]
+            free = waiting < 0
+            # Blocked when the car in the way stays, wait while it is undecided
+            blocker_status = status[np.where(free, 0, waiting)]
+            blocked = ~free & (blocker_status == BLOCKED)
+            ready = free | (blocker_status == MOVED)
+            late = ready & (ranks[pending] <= thresholds[pending])
+            blocked |= late
+            ready &= ~late
+            if not (blocked.any() or ready.any()):
+                break
+
+            status[pending[blocked]] = BLOCKED
+            ready = pending[ready]
+            cells = destinations[ready]
+            np.minimum.at(best, cells, ranks[ready])
+            won = ranks[ready] == best[cells]
+            status[ready[won]] = MOVED
+            status[ready[~won]] = BLOCKED
+            best[cells] = len(self.cars)
+            pending = pending[status[pending] == UNDECIDED]
+
+        status[status == UNDECIDED] = BLOCKED
+        return status
+
+    def step_agent(self, i):
+        """Step one car through CarAgent and read its state back."""
+        agent = self.cars[i]
+        agent.step()
+        self.positions[i] = agent.pos
+        self.active[i] = agent.active
+        self.distance_travelled[i] = agent.distance_travelled
+
+    def sync(self, moved):
+        """Update the agent views and the grid of the cars that moved.
+
+        The cell lists of the grid are edited in one pass, without the
+        per-call checks of MultiGrid.move_agent, unless the grid tracks
+        its empty cells and needs them.
+        """
+        grid = self.model.grid
+        cars = [self.cars[i] for i in moved]
+        positions = list(map(tuple, self.positions[moved].tolist()))
+        distances = self.distance_travelled[moved].tolist()
+        if grid._empties_built:
+            for agent, pos in zip(cars, positions):
+                grid.move_agent(agent, pos)
+        else:
+            cells = grid._grid
+            for agent, (x, y) in zip(cars, positions):
+                old_x, old_y = agent.pos
+                cells[old_x][old_y].remove(agent)
+                cells[x][y].append(agent)
+        for agent, pos, distance in zip(cars, positions, distances):
+            agent.pos = pos
+            agent.distance_travelled = distance
+        self.model.dirty_cars.update(cars)
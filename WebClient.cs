@@ -8,6 +8,42 @@ public class WebClient : MonoBehaviour
 
     public float timeToUpdate;
     public float dt;
+    public bool useStream = true;
+
+    // Reads the server-sent events of /stream as they arrive
+    class StreamHandler : DownloadHandlerScript
+    {
+        private string buffer = "";
+
+        public StreamHandler() : base(new byte[4096]) { }
+
+        protected override bool ReceiveData(byte[] data, int dataLength)
+        {
+            buffer += System.Text.Encoding.UTF8.GetString(data, 0, dataLength);
+            int end;
+            while ((end = buffer.IndexOf("\n\n")) >= 0)
+            {
+                string evt = buffer.Substring(0, end);
+                buffer = buffer.Substring(end + 2);
+                Debug.Log(evt);
+            }
+            return true;
+        }
+    }
+
+    IEnumerator StreamGlobalMap()
+    {
+        string url = "http://127.0.0.1:3000/stream";
+        using (UnityWebRequest www = UnityWebRequest.Get(url))
+        {
+            www.downloadHandler = new StreamHandler();
+            yield return www.SendWebRequest();
+            if (www.result == UnityWebRequest.Result.ConnectionError)
+            {
+                Debug.Log(www.error);
+            }
+        }
+    }
 
     IEnumerator UpdateStep()
     {
@@ -84,7 +120,10 @@ public class WebClient : MonoBehaviour
 
     void Start()
     {
-
+        if (useStream)
+        {
+            StartCoroutine(StreamGlobalMap());
+        }
     }
 
 
@@ -92,6 +131,11 @@ public class WebClient : MonoBehaviour
 
     void Update()
     {
+        if (useStream)
+        {
+            return;
+        }
+
         frameCounter++;
 
         if (frameCounter >= 480)
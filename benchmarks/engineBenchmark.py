@@ -0,0 +1,91 @@
+"""
+Engine Benchmark
+=============================================================
+Time the car phase of the step with each engine on the same model. The
+default case is the scale the vectorized engine was written for, 590
+cars on a generated 96x96 city with 1200 parking spots. Street closures
+are off so the car phase is the only work that differs between engines,
+and the step profiler splits the time of every phase.
+
+    python -m benchmarks.engineBenchmark
+    python -m benchmarks.engineBenchmark --size 160 --cars 1500 --parking 3200
+"""
+
+import argparse
+import time
+
+from mapBuild.cityGenerator import generate_city
+from TrafficModel import TrafficModel
+
+
+def run_engine(kwargs, cars, engine, steps, warmup, seed):
+    """Mean milliseconds per step of the whole step and of each phase."""
+    model = TrafficModel(
+        **kwargs,
+        num_agents=cars,
+        engine=engine,
+        seed=seed,
+        street_closures=False,
+        profile=True,
+    )
+    for _ in range(warmup):
+        model.step()
+    model.profiler.reset()
+    start = time.perf_counter_ns()
+    for _ in range(steps):
+        model.step()
+    elapsed = time.perf_counter_ns() - start
+    report = model.profiler.report()
+    return {
+        "step_ms": elapsed / 1e6 / steps,
+        "phases_ms": {
+            phase: summary["mean_ms"] for phase, summary in report["phases"].items()
+        },
+        "cars": len(model.cars),
+    }
+
+
+def run_engine_benchmark(
+    size=96,
+    cars=590,
+    parking=1200,
+    engines=("agents", "vectorized"),
+    steps=100,
+    warmup=5,
+    seed=1,
+):
+    """Benchmark every engine on one generated city, returns the results by engine."""
+    kwargs = generate_city(size, seed=0, num_parking=parking)
+    return {
+        engine: run_engine(kwargs, cars, engine, steps, warmup, seed)
+        for engine in engines
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the car stepping engines")
+    parser.add_argument("--size", type=int, default=96)
+    parser.add_argument("--cars", type=int, default=590)
+    parser.add_argument("--parking", type=int, default=1200)
+    parser.add_argument("--engines", nargs="+", default=["agents", "vectorized"])
+    parser.add_argument("--steps", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    results = run_engine_benchmark(
+        size=args.size,
+        cars=args.cars,
+        parking=args.parking,
+        engines=args.engines,
+        steps=args.steps,
+        warmup=args.warmup,
+        seed=args.seed,
+    )
+    baseline = results[args.engines[0]]["phases_ms"]["cars"]
+    for engine, result in results.items():
+        cars_ms = result["phases_ms"]["cars"]
+        print(
+            f"{engine:10} cars={result['cars']:<6} step {result['step_ms']:8.3f} ms "
+            f"car phase {cars_ms:8.3f} ms ({baseline / cars_ms:5.2f}x)"
+        )
@@ -0,0 +1,328 @@
+"""
+Benchmarks
+=============================================================
+Throughput and construction cost of the TrafficModel over a grid of
+map sizes, car counts and engines. Every case runs in a fresh process,
+so its peak RSS is its own, and each benchmark records the latency of
+every call it makes. The results go to a JSON file together with the
+commit they were measured on, and two result files can be compared to
+spot regressions between commits.
+
+    python -m benchmarks.runBenchmarks --sizes 24 96 --cars 10 50
+    python -m benchmarks.runBenchmarks --compare before.json after.json
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import platform
+import subprocess
+import sys
+import time
+
+import mesa
+import numpy as np
+
+from mapBuild.cityGenerator import generate_city
+from mapBuild.cityMaps import load_map
+from SimulationRunner import SimulationRunner
+from TrafficModel import TrafficModel
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Benchmarks run for every case, in order
+BENCHMARKS = (
+    "init",
+    "step",
+    "get_global_map",
+    "inteligent_move",
+    "signal_control",
+    "flask_global_map",
+)
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes, None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def summarize(samples, **extra):
+    """Latency statistics of a list of durations in nanoseconds."""
+    samples = np.asarray(samples, dtype=np.float64) / 1e9
+    if samples.size == 0:
+        return {"calls": 0, **extra}
+    p50, p90, p99 = np.percentile(samples, [50, 90, 99])
+    return {
+        "calls": int(samples.size),
+        "total": float(samples.sum()),
+        "mean": float(samples.mean()),
+        "min": float(samples.min()),
+        "p50": float(p50),
+        "p90": float(p90),
+        "p99": float(p99),
+        "max": float(samples.max()),
+        **extra,
+    }
+
+
+def map_kwargs(size, cars):
+    """Map of a case, the hand-made one for size 0 and a generated one otherwise.
+
+    Each car takes its spawn spot and reserves its target, so generated
+    maps get two parking spots per car.
+    """
+    if size == 0:
+        return load_map("default")
+    return generate_city(size, seed=0, num_parking=max(2 * cars, 2))
+
+
+def bench_init(kwargs, cars, engine, seed, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        TrafficModel(**kwargs, num_agents=cars, engine=engine, seed=seed)
+        samples.append(time.perf_counter_ns() - start)
+    return summarize(samples)
+
+
+def bench_step(model, steps):
+    samples = []
+    for _ in range(steps):
+        start = time.perf_counter_ns()
+        model.step()
+        samples.append(time.perf_counter_ns() - start)
+    summary = summarize(samples)
+    summary["steps_per_second"] = steps / summary["total"] if steps else 0.0
+    return summary
+
+
+def bench_get_global_map(model, steps):
+    samples = []
+    for _ in range(steps):
+        model.step()
+        # The step already built the map of this step, build it again
+        model.global_map_step = None
+        start = time.perf_counter_ns()
+        model.get_global_map()
+        samples.append(time.perf_counter_ns() - start)
+    return summarize(samples)
+
+
+def bench_inteligent_move(model, steps):
+    samples = []
+    for _ in range(steps):
+        for agent in list(model.moving_cars):
+            if not agent.target_id:
+                continue
+            start = time.perf_counter_ns()
+            agent.inteligent_move()
+            samples.append(time.perf_counter_ns() - start)
+        model.step()
+    return summarize(samples)
+
+
+def bench_signal_control(model, steps):
+    samples = []
+    for _ in range(steps):
+        model.step()
+        start = time.perf_counter_ns()
+        model.signal_controller.step()
+        samples.append(time.perf_counter_ns() - start)
+    return summarize(samples, groups=len(model.signal_groups))
+
+
+def bench_flask_global_map(model, steps):
+    import server
+
+    # Serve the case model, stepping once a second so the requests do not
+    # compete with the simulation loop for the interpreter
+    runner = SimulationRunner(model, tick_rate=1)
+    server.runner = runner
+    client = server.app.test_client()
+    samples = []
+    sizes = []
+    try:
+        for _ in range(steps):
+            start = time.perf_counter_ns()
+            response = client.get("/global_map")
+            body = response.get_data()
+            samples.append(time.perf_counter_ns() - start)
+            sizes.append(len(body))
+    finally:
+        runner.stop()
+    return summarize(samples, response_bytes=int(np.mean(sizes)) if sizes else 0)
+
+
+# Benchmarks of a model already built and warmed up, by name
+MODEL_BENCHMARKS = {
+    "step": bench_step,
+    "get_global_map": bench_get_global_map,
+    "inteligent_move": bench_inteligent_move,
+    "signal_control": bench_signal_control,
+    "flask_global_map": bench_flask_global_map,
+}
+
+
+def run_case(case, benchmarks, steps, warmup, repeat, seed):
+    """Run the benchmarks of one case, meant for a process of its own."""
+    size, cars, engine = case["size"], case["num_agents"], case["engine"]
+    kwargs = map_kwargs(size, cars)
+    results = []
+
+    def record(name, summary):
+        results.append({"benchmark": name, **case, **summary})
+
+    for name in benchmarks:
+        # The vectorized engine moves its cars without CarAgent
+        if name == "inteligent_move" and engine != "agents":
+            continue
+        if name == "init":
+            record(name, bench_init(kwargs, cars, engine, seed, repeat))
+            continue
+        model = TrafficModel(**kwargs, num_agents=cars, engine=engine, seed=seed)
+        for _ in range(warmup):
+            model.step()
+        record(name, MODEL_BENCHMARKS[name](model, steps))
+
+    # The peak of the whole case, every benchmark of it shares the process
+    for result in results:
+        result["peak_rss"] = peak_rss()
+    return results
+
+
+def environment():
+    """Description of the code and machine the results were measured on."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "mesa": mesa.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+    }
+
+
+def run_benchmarks(
+    sizes=(0, 24, 96),
+    cars=(10, 50),
+    engines=("agents", "vectorized"),
+    benchmarks=BENCHMARKS,
+    steps=100,
+    warmup=10,
+    repeat=5,
+    seed=0,
+):
+    """Run every benchmark over the grid of cases, returns the report."""
+    cases = [
+        {"size": size, "num_agents": count, "engine": engine}
+        for size, count, engine in itertools.product(sizes, cars, engines)
+    ]
+    results = []
+    # A fresh process per case keeps the peak RSS of the cases apart
+    context = multiprocessing.get_context("spawn")
+    for case in cases:
+        with context.Pool(1) as pool:
+            results.extend(
+                pool.apply(run_case, (case, benchmarks, steps, warmup, repeat, seed))
+            )
+    return {"environment": environment(), "results": results}
+
+
+def compare(before, after, threshold=0.1):
+    """Print the change of the mean latency of every result in both reports.
+
+    Returns the number of results slower by more than `threshold`.
+    """
+
+    def key(result):
+        return (
+            result["benchmark"],
+            result["size"],
+            result["num_agents"],
+            result["engine"],
+        )
+
+    previous = {key(result): result for result in before["results"]}
+    regressions = 0
+    print(f"{before['environment']['commit']} -> {after['environment']['commit']}")
+    for result in after["results"]:
+        old = previous.get(key(result))
+        if old is None or not old.get("mean") or "mean" not in result:
+            continue
+        change = result["mean"] / old["mean"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        benchmark, size, count, engine = key(result)
+        print(
+            f"{benchmark:18} size={size:<5} cars={count:<6} {engine:10} "
+            f"{old['mean'] * 1e3:10.3f} ms -> {result['mean'] * 1e3:10.3f} ms "
+            f"{change:+7.1%}{flag}"
+        )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the TrafficModel")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[0, 24, 96],
+        help="Cells per side of the generated maps, 0 for the hand-made map",
+    )
+    parser.add_argument("--cars", type=int, nargs="+", default=[10, 50])
+    parser.add_argument("--engines", nargs="+", default=["agents", "vectorized"])
+    parser.add_argument(
+        "--benchmarks", nargs="+", default=list(BENCHMARKS), choices=BENCHMARKS
+    )
+    parser.add_argument("--steps", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmarks.json")
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("BEFORE", "AFTER"),
+        help="Compare two result files instead of running the benchmarks",
+    )
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as file:
+            before = json.load(file)
+        with open(args.compare[1]) as file:
+            after = json.load(file)
+        sys.exit(1 if compare(before, after, args.threshold) else 0)
+
+    report = run_benchmarks(
+        sizes=args.sizes,
+        cars=args.cars,
+        engines=args.engines,
+        benchmarks=args.benchmarks,
+        steps=args.steps,
+        warmup=args.warmup,
+        repeat=args.repeat,
+        seed=args.seed,
+    )
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"{len(report['results'])} results written to {args.output}")
@@ -0,0 +1,80 @@
+"""
+Engine Replay Check
+=============================================================
+Check that the conflict resolution of the vectorized engine gives the
+same moves as stepping the cars one at a time. Each case places cars
+on random cells, lets some of them ask for a random cell, and compares
+VectorizedEngine.resolve with a sequential replay of the cars in the
+priority order the engine draws: a car moves if its cell is free when
+its turn comes.
+
+    python -m checks.engineReplay --cases 3000
+"""
+
+import argparse
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+
+from VectorizedEngine import BLOCKED, MOVED, VectorizedEngine
+
+
+def random_case(rng):
+    """Cells, car of each cell, candidates and their destinations of one case."""
+    num_cells = int(rng.integers(2, 40))
+    num_cars = int(rng.integers(1, num_cells + 1))
+    cells = rng.permutation(num_cells)[:num_cars]
+    cell_car = np.full(num_cells, -1, dtype=np.int64)
+    cell_car[cells] = np.arange(num_cars)
+    candidates = np.flatnonzero(rng.random(num_cars) < 0.8)
+    # Every candidate asks for a cell other than its own
+    offsets = rng.integers(1, num_cells, size=len(candidates))
+    destinations = (cells[candidates] + offsets) % num_cells
+    return cells, cell_car, candidates, destinations
+
+
+def replay(priority, cells, cell_car, candidates, destinations):
+    """Status of each candidate when the cars step one at a time."""
+    occupied = cell_car >= 0
+    wanted = dict(zip(candidates.tolist(), destinations.tolist()))
+    status = {}
+    for car in np.argsort(priority).tolist():
+        if car not in wanted:
+            continue
+        destination = wanted[car]
+        if occupied[destination]:
+            status[car] = BLOCKED
+            continue
+        occupied[cells[car]] = False
+        occupied[destination] = True
+        status[car] = MOVED
+    return np.array([status[car] for car in candidates.tolist()], dtype=np.int8)
+
+
+def check_case(seed):
+    """Whether the engine and the replay agree on the case of a seed."""
+    cells, cell_car, candidates, destinations = random_case(np.random.default_rng(seed))
+    num_cars = len(cells)
+    # The engine draws its priorities from the model generator
+    engine = SimpleNamespace(
+        cars=[None] * num_cars,
+        size=num_cars,
+        model=SimpleNamespace(rng=np.random.default_rng([seed, 1])),
+    )
+    status = VectorizedEngine.resolve(engine, candidates, destinations, cell_car)
+    priority = np.random.default_rng([seed, 1]).permutation(num_cars)
+    expected = replay(priority, cells, cell_car, candidates, destinations)
+    return np.array_equal(status, expected)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the engine against a replay")
+    parser.add_argument("--cases", type=int, default=3000)
+    args = parser.parse_args()
+
+    failed = [seed for seed in range(args.cases) if not check_case(seed)]
+    print(f"{args.cases - len(failed)}/{args.cases} cases match the sequential replay")
+    if failed:
+        print(f"First mismatching seeds: {failed[:10]}")
+    sys.exit(1 if failed else 0)
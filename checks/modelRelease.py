@@ -0,0 +1,102 @@
+"""
+Model Release Check
+=============================================================
+Check that the models the batch runner builds are garbage collected
+once their run is summarized, and that the model of a session is once
+the session is closed. Mesa keeps every model referenced in Agent._ids,
+so a model that is not released stays in memory for the life of the
+worker process. Each model is tracked with a weak reference, which must
+be dead after a garbage collection. The session worker loop runs on a
+thread of this process so its models can be tracked.
+
+    python -m checks.modelRelease --runs 5
+"""
+
+import argparse
+import gc
+import sys
+import threading
+import weakref
+from multiprocessing import Pipe
+
+import BatchRunner
+import SessionPool
+from SessionPool import build_model
+
+
+def tracking(module, models):
+    """Make a module build its models through a builder that tracks them."""
+
+    def tracked_build_model(**kwargs):
+        model = build_model(**kwargs)
+        models.append(weakref.ref(model))
+        return model
+
+    module.build_model = tracked_build_model
+
+
+def alive(models):
+    """Number of the tracked models still in memory."""
+    gc.collect()
+    return sum(model() is not None for model in models)
+
+
+def check_run_model(runs, steps):
+    """Number of batch runner models still alive after their run."""
+    models = []
+    tracking(BatchRunner, models)
+    try:
+        for run_id in range(runs):
+            BatchRunner.run_model(
+                run_id, {"num_agents": 10, "spawn_rate": 0.5}, 0, run_id, steps
+            )
+    finally:
+        BatchRunner.build_model = build_model
+    return alive(models)
+
+
+def check_sessions(sessions):
+    """Models still alive after their sessions are closed, and after a shutdown."""
+    models = []
+    tracking(SessionPool, models)
+    connection, worker_connection = Pipe()
+    worker = threading.Thread(
+        target=SessionPool.serve_sessions, args=(worker_connection,), daemon=True
+    )
+    worker.start()
+
+    def request(command, session_id=None, args=None):
+        connection.send((command, session_id, args))
+        status, result = connection.recv()
+        assert status == "ok", result
+        return result
+
+    try:
+        for session_id in range(sessions):
+            request("create", session_id, {"num_agents": 10, "seed": session_id})
+            request("snapshot", session_id)
+        for session_id in range(sessions):
+            request("close", session_id)
+        closed = alive(models)
+        request("create", sessions, {"num_agents": 10})
+        request("shutdown")
+        worker.join()
+    finally:
+        SessionPool.build_model = build_model
+    return closed, alive(models)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that models are freed")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--steps", type=int, default=20)
+    args = parser.parse_args()
+
+    run_alive = check_run_model(args.runs, args.steps)
+    print(f"run_model: {args.runs - run_alive}/{args.runs} models freed")
+    closed_alive, shutdown_alive = check_sessions(args.runs)
+    print(f"close: {args.runs - closed_alive}/{args.runs} session models freed")
+    print(
+        f"shutdown: {args.runs + 1 - shutdown_alive}/{args.runs + 1} session models freed"
+    )
+    sys.exit(1 if run_alive or closed_alive or shutdown_alive else 0)
@@ -0,0 +1,77 @@
+"""
+Routing Repair Check
+=============================================================
+Check that repairing the routing tables after each street toggle leaves
+them exactly as a full search would. Each map gets a series of random
+closes and reopens of its allowed moves, and after every toggle the
+repaired distances and next hops are compared with a RoutingTable built
+from scratch on the same road network.
+
+    python -m checks.routingRepair --toggles 300
+"""
+
+import argparse
+import sys
+
+import numpy as np
+
+from mapBuild.cityGenerator import generate_city
+from mapBuild.cityMaps import load_map
+from RoadNetwork import MOVE_DIRECTIONS, RoadNetwork
+from RoutingTable import RoutingTable
+
+
+def check_map(kwargs, toggles, seed):
+    """Number of toggles after which the repaired tables differ from a rebuild."""
+    network = RoadNetwork(kwargs["width"], kwargs["height"], kwargs["coords"])
+    spots = {key: tuple(spot) for key, spot in enumerate(kwargs["parking_coords"], 1)}
+    routing = RoutingTable(network, spots)
+    moves = [
+        (tuple(pos), d)
+        for pos in np.argwhere(network.masks).tolist()
+        for d in range(len(MOVE_DIRECTIONS))
+        if network.masks[tuple(pos)] >> d & 1
+    ]
+
+    rng = np.random.default_rng(seed)
+    closed = []
+    mismatches = 0
+    for _ in range(toggles):
+        # Reopen a closed move now and then, close another one otherwise
+        if closed and rng.random() < 0.4:
+            pos, d = closed.pop(rng.integers(len(closed)))
+            allowed = True
+        else:
+            pos, d = moves.pop(rng.integers(len(moves)))
+            closed.append((pos, d))
+            allowed = False
+        if allowed:
+            moves.append((pos, d))
+        network.set_direction(pos, MOVE_DIRECTIONS[d], allowed)
+        routing.toggle(pos, d, allowed)
+
+        rebuilt = RoutingTable(network, spots)
+        if not (
+            np.array_equal(routing.distances, rebuilt.distances)
+            and np.array_equal(routing.next_hop, rebuilt.next_hop)
+        ):
+            mismatches += 1
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the routing table repairs")
+    parser.add_argument("--toggles", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    maps = {
+        "default": load_map("default"),
+        "city_48": generate_city(48, seed=args.seed, num_parking=40),
+    }
+    failed = 0
+    for name, kwargs in maps.items():
+        mismatches = check_map(kwargs, args.toggles, args.seed)
+        failed += mismatches
+        print(f"{name}: {args.toggles - mismatches}/{args.toggles} toggles match")
+    sys.exit(1 if failed else 0)
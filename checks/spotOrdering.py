@@ -0,0 +1,118 @@
+"""
+Spot Ordering Check
+=============================================================
+Check that a random draw of the ParkingManager picks the same spot as
+random.choice on the ordered list of spots it replaced. Each case
+occupies, vacates, reserves and releases random spots, and after every
+change draws from each spot set, with and without an excluded spot,
+through the manager and through the ordered list, with generators of
+the same seed. Nearest available spot queries on toroidal grids of
+random sizes are checked against a scan of every spot by the distance
+wrapped around the edges.
+
+    python -m checks.spotOrdering --cases 300
+"""
+
+import argparse
+import random
+import sys
+
+from ParkingManager import ParkingManager
+
+# Changes applied to random spots of the manager
+CHANGES = ("occupy", "vacate", "reserve", "unreserve")
+
+
+def draws_match(manager, spots, members, seed, exclude):
+    """Whether the manager and random.choice draw the same spot."""
+    ordered = [key for key in sorted(members) if key != exclude]
+    expected = random.Random(seed).choice(ordered) if ordered else None
+    drawn = manager.random_spot(spots, random.Random(seed), exclude)
+    return drawn == expected
+
+
+def check_case(seed, changes=200):
+    """Whether every draw of the case of a seed matches the ordered list."""
+    rng = random.Random(seed)
+    size = rng.randint(1, 60)
+    manager = ParkingManager({key: (key, 0) for key in range(1, size + 1)})
+    vacant = set(range(1, size + 1))
+    unreserved = set(range(1, size + 1))
+
+    for _ in range(changes):
+        change = rng.choice(CHANGES)
+        key = rng.randint(1, size)
+        getattr(manager, change)(key)
+        if change == "occupy":
+            vacant.discard(key)
+        elif change == "vacate":
+            vacant.add(key)
+        elif change == "reserve":
+            unreserved.discard(key)
+        else:
+            unreserved.add(key)
+
+        sets = (
+            (manager.vacant, vacant),
+            (manager.unreserved, unreserved),
+            (manager.available, vacant & unreserved),
+        )
+        draw_seed = rng.getrandbits(32)
+        exclude = rng.choice((None, rng.randint(1, size)))
+        for spots, members in sets:
+            if not draws_match(manager, spots, members, draw_seed, exclude):
+                return False
+    return True
+
+
+def wrapped_nearest(spots, available, pos, width, height, exclude):
+    """Nearest available spot to a cell by scanning every spot of a torus."""
+    x, y = pos
+    candidates = []
+    for key in available - {exclude}:
+        dx, dy = abs(spots[key][0] - x), abs(spots[key][1] - y)
+        candidates.append((min(dx, width - dx) + min(dy, height - dy), key))
+    return min(candidates)[1] if candidates else None
+
+
+def check_nearest_case(seed, queries=50):
+    """Whether every nearest spot query of the case of a seed matches a scan."""
+    rng = random.Random(seed)
+    width, height = rng.randint(1, 40), rng.randint(1, 40)
+    size = rng.randint(0, 40)
+    spots = {
+        key: (rng.randrange(width), rng.randrange(height)) for key in range(1, size + 1)
+    }
+    manager = ParkingManager(
+        spots, bucket_size=rng.randint(1, 7), width=width, height=height
+    )
+    available = set(spots)
+    for key in spots:
+        if rng.random() < 0.4:
+            manager.occupy(key)
+            available.discard(key)
+
+    for _ in range(queries):
+        pos = (rng.randrange(width), rng.randrange(height))
+        exclude = rng.choice((None, rng.randint(1, size + 1)))
+        expected = wrapped_nearest(spots, available, pos, width, height, exclude)
+        if manager.nearest_available(pos, exclude) != expected:
+            return False
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the order of spot draws")
+    parser.add_argument("--cases", type=int, default=300)
+    args = parser.parse_args()
+
+    failed = [seed for seed in range(args.cases) if not check_case(seed)]
+    print(f"{args.cases - len(failed)}/{args.cases} cases draw like random.choice")
+    if failed:
+        print(f"First mismatching seeds: {failed[:10]}")
+
+    missed = [seed for seed in range(args.cases) if not check_nearest_case(seed)]
+    print(f"{args.cases - len(missed)}/{args.cases} cases find the nearest spot")
+    if missed:
+        print(f"First mismatching seeds: {missed[:10]}")
+    sys.exit(1 if failed or missed else 0)
@@ -0,0 +1,161 @@
+# Procedural city maps of any size, in the data model of the hand-made map
+#
+# The city is a torus of square blocks separated by two-lane one-way
+# streets, every `block_size + 2` cells along each axis. The direction of
+# each street is drawn from the seed. Since every street is a loop that
+# crosses all the streets of the other axis, every lane cell can reach
+# every other one.
+#
+# Like the hand-made map:
+#   - cars may change lane diagonally between intersections
+#   - parking spots sit on the block borders, entered from the lane next
+#     to them and left back onto it
+#   - each intersection has one signal group per entering street, with two
+#     lights on the cells before it and the cells upstream as monitored area
+#   - each street segment has a monitoring zone per lane, which closes the
+#     lane where it leaves the previous intersection
+import numpy as np
+
+from RoadNetwork import DIRECTION_BITS, DIRECTIONS, OFFSETS
+
+# Initial state of the generated traffic lights, idle
+INITIAL_LIGHT_STATE = 3
+
+
+# Coordinates of the nonzero cells of a grid, as tuples of ints
+def _cells(grid):
+    return list(map(tuple, np.argwhere(grid).tolist()))
+
+
+# Keyword arguments of TrafficModel for a generated city of size x size cells
+def generate_city(size=24, seed=0, block_size=10, num_parking=None, monitor_length=3):
+    if block_size < 4:
+        raise ValueError("Blocks need at least 4 cells per side")
+    pitch = block_size + 2
+    count = size // pitch
+    if count < 1:
+        raise ValueError(f"A city with blocks of {block_size} needs {pitch} cells")
+    rng = np.random.default_rng(seed)
+
+    # First lane of each street, the same for both axes
+    starts = [i * pitch for i in range(count)]
+    horizontal = [("left", "right")[i] for i in rng.integers(2, size=count)]
+    vertical = [("down", "up")[i] for i in rng.integers(2, size=count)]
+
+    lanes = np.zeros((size, size), dtype=bool)
+    masks = np.zeros((size, size), dtype=np.uint16)
+    for y, direction in zip(starts, horizontal):
+        lanes[:, y : y + 2] = True
+        masks[:, y : y + 2] |= DIRECTION_BITS[direction]
+    for x, direction in zip(starts, vertical):
+        lanes[x : x + 2, :] = True
+        masks[x : x + 2, :] |= DIRECTION_BITS[direction]
+    crossings = np.zeros((size, size), dtype=bool)
+    for x in starts:
+        for y in starts:
+            crossings[x : x + 2, y : y + 2] = True
+
+    # Lane changes towards the other lane, only between intersections
+    changes = {}
+    for y, direction in zip(starts, horizontal):
+        for offset, towards in ((0, "up"), (1, "down")):
+            lane = changes.setdefault(f"{towards}_{direction}", np.zeros_like(lanes))
+            lane[:, y + offset] = True
+    for x, direction in zip(starts, vertical):
+        for offset, towards in ((0, "right"), (1, "left")):
+            lane = changes.setdefault(f"{direction}_{towards}", np.zeros_like(lanes))
+            lane[x + offset, :] = True
+    for direction, lane in changes.items():
+        dx, dy = OFFSETS[direction]
+        into_crossing = np.roll(crossings, (-dx, -dy), axis=(0, 1))
+        masks[lane & ~crossings & ~into_crossing] |= DIRECTION_BITS[direction]
+
+    # Segments of each street between two intersections, in driving order,
+    # as (lane cells, cells of the intersection they leave, direction)
+    segments = []
+    for i, start in enumerate(starts):
+        gap = (starts[(i + 1) % count] - start) % size or size
+        block = [(start + 2 + k) % size for k in range(gap - 2)]
+        # Lanes crossing the block, the intersections at both of its ends
+        for y, direction in zip(starts, horizontal):
+            lanes_of = [[(x, y) for x in block], [(x, y + 1) for x in block]]
+            before = start + 1 if direction == "right" else (start + gap) % size
+            segments.append(
+                (lanes_of, [(before, y), (before, y + 1)], direction, "horizontal")
+            )
+        for x, direction in zip(starts, vertical):
+            lanes_of = [[(x, y) for y in block], [(x + 1, y) for y in block]]
+            before = start + 1 if direction == "up" else (start + gap) % size
+            segments.append(
+                (lanes_of, [(x, before), (x + 1, before)], direction, "vertical")
+            )
+
+    # Signal groups on the last cells of every segment, before the next
+    # intersection, monitoring them and the cells upstream
+    traffic_light_coords = []
+    for lanes_of, _, direction, _ in segments:
+        ordered = [
+            lane if direction in ("right", "up") else lane[::-1] for lane in lanes_of
+        ]
+        positions = [lane[-1] for lane in ordered]
+        monitored = positions + [
+            cell for lane in ordered for cell in lane[-1 - monitor_length : -1][::-1]
+        ]
+        traffic_light_coords.append(
+            [positions[0], positions[1], INITIAL_LIGHT_STATE, monitored]
+        )
+
+    # Parking spots next to the lanes, away from the block corners and so
+    # from the lights, with the door direction from the lane into the spot
+    sides = {"horizontal": ("down", "up"), "vertical": ("left", "right")}
+    candidates = []
+    for lanes_of, _, _, axis in segments:
+        for lane, door in zip(lanes_of, sides[axis]):
+            dx, dy = OFFSETS[door]
+            for x, y in lane[1:-1]:
+                spot = ((x + dx) % size, (y + dy) % size)
+                candidates.append((spot, (x, y), door))
+    if num_parking is None:
+        num_parking = count * count
+    num_parking = min(num_parking, len(candidates))
+    chosen = np.sort(rng.choice(len(candidates), size=num_parking, replace=False))
+
+    opposite = {"left": "right", "right": "left", "up": "down", "down": "up"}
+    parking_coords = []
+    doors = {}
+    for index in chosen:
+        spot, door, direction = candidates[index]
+        masks[door] |= DIRECTION_BITS[direction]
+        masks[spot] = DIRECTION_BITS[opposite[direction]]
+        parking_coords.append(spot)
+        doors[door] = len(parking_coords)
+
+    # One monitoring zone per lane of every segment
+    monitoring_coords = {}
+    for lanes_of, leaving, direction, _ in segments:
+        area = [cell for lane in lanes_of for cell in lane]
+        destinations = sorted(doors[cell] for cell in area if cell in doors)
+        for pos in leaving:
+            monitoring_coords[len(monitoring_coords) + 1] = {
+                "pos": pos,
+                "area": area,
+                "direction": direction,
+                "posible_destinations": destinations,
+            }
+
+    coords = {
+        f"{direction}_coords": _cells(masks & DIRECTION_BITS[direction])
+        for direction in DIRECTIONS[:8]
+    }
+    coords["monitoring_coords"] = monitoring_coords
+    buildings = ~lanes
+    buildings[tuple(np.array(parking_coords, dtype=np.int64).reshape(-1, 2).T)] = False
+
+    return {
+        "width": size,
+        "height": size,
+        "coords": coords,
+        "buildings_coords": _cells(buildings),
+        "parking_coords": parking_coords,
+        "traffic_light_coords": traffic_light_coords,
+    }
@@ -0,0 +1,60 @@
+# Maps available to build a TrafficModel, by name
+from functools import partial
+
+from mapBuild.cityGenerator import generate_city
+from mapBuild.parkingSpots import parking_spots
+from mapBuild.buildings import buildings_coords
+from mapBuild.trafficLights import traffic_light_coords
+
+from mapBuild.leftCoords import left_coords
+from mapBuild.rightCoords import right_coords
+from mapBuild.upCoords import up_coords
+from mapBuild.downCoords import down_coords
+
+from mapBuild.downLeftCoords import down_left_coords
+from mapBuild.downRightCoords import down_right_coords
+from mapBuild.upLeftCoords import up_left_coords
+from mapBuild.upRightCoords import up_right_coords
+
+from mapBuild.monitoring_coords import monitoring_coords
+
+
+# Hand-made 24x24 city, as keyword arguments of TrafficModel
+def default_map():
+    return {
+        "width": 24,
+        "height": 24,
+        "coords": {
+            "left_coords": left_coords,
+            "right_coords": right_coords,
+            "up_coords": up_coords,
+            "down_coords": down_coords,
+            "down_left_coords": down_left_coords,
+            "down_right_coords": down_right_coords,
+            "up_left_coords": up_left_coords,
+            "up_right_coords": up_right_coords,
+            "monitoring_coords": monitoring_coords,
+        },
+        "buildings_coords": buildings_coords,
+        "parking_coords": parking_spots,
+        "traffic_light_coords": traffic_light_coords,
+    }
+
+
+maps = {
+    "default": default_map,
+}
+
+# Generated cities for scale testing, by cells per side. The routing tables
+# hold a grid per parking spot, so the spots are few enough for the largest
+# cities to fit in memory
+CITY_SIZES = (24, 96, 240, 480, 1000, 2000)
+for size in CITY_SIZES:
+    maps[f"city_{size}"] = partial(generate_city, size, num_parking=32)
+
+
+# Get the TrafficModel keyword arguments of a map by name
+def load_map(name="default"):
+    if name not in maps:
+        raise ValueError(f"Unknown map: {name}")
+    return maps[name]()
@@ -0,0 +1,177 @@
+# Compiler of city maps into a single versioned binary file
+#
+# Layout of a compiled map, all integers little endian:
+#   magic     8 bytes, b"CITYMAP\0"
+#   version   uint32
+#   length    uint32, size of the JSON header
+#   header    JSON with the map size, the small structured data (parking
+#             spots, traffic lights, monitoring zones) and the dtype, shape
+#             and offset of every array
+#   arrays    raw C-ordered arrays, each one aligned to 64 bytes
+#
+# The arrays are read through np.memmap, so loading does not copy them and
+# processes opening the same file share its pages until they write to them.
+# Besides the routing tables, the file holds every static grid a model
+# would otherwise build at start up: the cell layers, the parking spot
+# index and the random walk tables.
+import json
+import struct
+import sys
+
+import numpy as np
+
+from RoadNetwork import MoveTable, RoadNetwork
+from RoutingTable import RoutingTable
+
+MAGIC = b"CITYMAP\0"
+VERSION = 2
+EXTENSION = ".citymap"
+ALIGNMENT = 64
+PREFIX = struct.Struct("<8sII")
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+# Grid with the given value on the cells listed
+def _layer(width, height, cells, value=1, dtype=np.int64):
+    layer = np.zeros((width, height), dtype=dtype)
+    if len(cells):
+        xs, ys = np.asarray(cells).reshape(-1, 2).T
+        layer[xs, ys] = value
+    return layer
+
+
+# Compile the TrafficModel keyword arguments of a map into a file
+def compile_map(map_kwargs, path):
+    width, height = map_kwargs["width"], map_kwargs["height"]
+    coords = map_kwargs["coords"]
+    parking = [tuple(spot) for spot in map_kwargs["parking_coords"]]
+
+    road_network = RoadNetwork(width, height, coords)
+    parking_spots = {i + 1: spot for i, spot in enumerate(parking)}
+    routing = RoutingTable(road_network, parking_spots)
+    move_table = MoveTable(road_network, parking)
+    monitored = [
+        cell for light in map_kwargs["traffic_light_coords"] for cell in light[-1]
+    ]
+    arrays = {
+        "masks": road_network.masks,
+        "buildings": np.asarray(map_kwargs["buildings_coords"], np.int32).reshape(
+            -1, 2
+        ),
+        "parking": np.asarray(parking, np.int32).reshape(-1, 2),
+        "distances": routing.distances,
+        "next_hop": routing.next_hop,
+        "building_layer": _layer(width, height, map_kwargs["buildings_coords"]),
+        "parking_layer": _layer(width, height, parking),
+        "monitoring_layer": _layer(width, height, monitored),
+        "parking_id": _layer(
+            width, height, parking, list(parking_spots), dtype=np.int32
+        ),
+        "move_cumulative": move_table.cumulative,
+    }
+
+    header = {
+        "width": width,
+        "height": height,
+        "traffic_lights": map_kwargs["traffic_light_coords"],
+        "monitoring": [
+            [key, zone] for key, zone in coords.get("monitoring_coords", {}).items()
+        ],
+        "arrays": {},
+    }
+    # Offsets are relative to the end of the header, which depends on them
+    offset = 0
+    for name, array in arrays.items():
+        offset = _align(offset)
+        header["arrays"][name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": offset,
+        }
+        offset += array.nbytes
+    encoded = json.dumps(header).encode()
+    start = _align(PREFIX.size + len(encoded))
+
+    with open(path, "wb") as file:
+        file.write(PREFIX.pack(MAGIC, VERSION, len(encoded)))
+        file.write(encoded)
+        for name, array in arrays.items():
+            file.seek(start + header["arrays"][name]["offset"])
+            file.write(np.ascontiguousarray(array).tobytes())
+
+
+class CompiledMap:
+    def __init__(self, header, arrays):
+        self.width = header["width"]
+        self.height = header["height"]
+        self.arrays = arrays
+        self.masks = arrays["masks"]
+        self.distances = arrays["distances"]
+        self.next_hop = arrays["next_hop"]
+
+        # JSON turned the tuples into lists and the zone keys stay as given
+        self.parking_coords = [tuple(map(int, spot)) for spot in arrays["parking"]]
+        self.buildings_coords = [tuple(map(int, cell)) for cell in arrays["buildings"]]
+        self.traffic_light_coords = [
+            [tuple(light[0]), tuple(light[1]), light[2], [tuple(p) for p in light[3]]]
+            for light in header["traffic_lights"]
+        ]
+        self.monitoring_coords = {
+            key: {
+                **zone,
+                "pos": tuple(zone["pos"]),
+                "area": [tuple(cell) for cell in zone["area"]],
+            }
+            for key, zone in header["monitoring"]
+        }
+
+    # TrafficModel keyword arguments of the map
+    def model_kwargs(self):
+        return {
+            "width": self.width,
+            "height": self.height,
+            "coords": {"monitoring_coords": self.monitoring_coords},
+            "buildings_coords": self.buildings_coords,
+            "parking_coords": self.parking_coords,
+            "traffic_light_coords": self.traffic_light_coords,
+        }
+
+
+# Load a compiled map, its arrays are copy-on-write views of the file
+def load_compiled_map(path, mode="c"):
+    with open(path, "rb") as file:
+        magic, version, length = PREFIX.unpack(file.read(PREFIX.size))
+        if magic != MAGIC:
+            raise ValueError(f"Not a compiled map: {path}")
+        if version != VERSION:
+            raise ValueError(
+                f"Unsupported compiled map version {version}, expected {VERSION}"
+            )
+        header = json.loads(file.read(length))
+
+    start = _align(PREFIX.size + length)
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        shape = tuple(spec["shape"])
+        if np.prod(shape) == 0:
+            arrays[name] = np.zeros(shape, dtype=spec["dtype"])
+            continue
+        arrays[name] = np.memmap(
+            path,
+            dtype=spec["dtype"],
+            mode=mode,
+            offset=start + spec["offset"],
+            shape=shape,
+        )
+    return CompiledMap(header, arrays)
+
+
+if __name__ == "__main__":
+    from mapBuild.cityMaps import load_map
+
+    if len(sys.argv) != 3:
+        sys.exit("Usage: python -m mapBuild.mapCompiler <map name> <output path>")
+    compile_map(load_map(sys.argv[1]), sys.argv[2])
@@ -1,56 +1,51 @@
-from flask import Flask, jsonify
+import json
+import os
+import time
+
+from flask import Flask, Response, jsonify, request, stream_with_context
+from SessionPool import SessionPool
+from SimulationRunner import SimulationRunner
 from TrafficModel import TrafficModel
 
 """
-Import the mapBuild module and the necessary files to create the model.
+Import the mapBuild module to load the map of the model.
 """
-from mapBuild.parkingSpots import parking_spots
-from mapBuild.buildings import buildings_coords
-from mapBuild.trafficLights import traffic_light_coords
-
-from mapBuild.leftCoords import left_coords
-from mapBuild.rightCoords import right_coords
-from mapBuild.upCoords import up_coords
-from mapBuild.downCoords import down_coords
-
-from mapBuild.downLeftCoords import down_left_coords
-from mapBuild.downRightCoords import down_right_coords
-from mapBuild.upLeftCoords import up_left_coords
-from mapBuild.upRightCoords import up_right_coords
-
-from mapBuild.monitoring_coords import monitoring_coords
-
-# Storing the coordinates in a dictionary
-coords = {
-    "left_coords": left_coords,
-    "right_coords": right_coords,
-    "up_coords": up_coords,
-    "down_coords": down_coords,
-    "down_left_coords": down_left_coords,
-    "down_right_coords": down_right_coords,
-    "up_left_coords": up_left_coords,
-    "up_right_coords": up_right_coords,
-    "monitoring_coords": monitoring_coords,
-}
+from mapBuild.cityMaps import load_map
 
 # Initialize the Flask application
 app = Flask(__name__)
 
 
-# Initialize the TrafficModel with the specified parameters
+# Initialize the TrafficModel with the specified parameters, timing its
+# steps for /metrics when SIMULATION_PROFILE is set. The model runs for as
+# long as the server, so it only samples its data every
+# SIMULATION_COLLECT_INTERVAL steps, into SIMULATION_COLLECT_PATH if set
+seed = os.environ.get("SIMULATION_SEED")
+collect_interval = int(os.environ.get("SIMULATION_COLLECT_INTERVAL", 10))
 model = TrafficModel(
     num_agents=10,
-    width=24,
-    height=24,
-    coords=coords,
-    buildings_coords=buildings_coords,
-    parking_coords=parking_spots,
-    traffic_light_coords=traffic_light_coords,
+    seed=None if seed is None else int(seed),
+    profile=os.environ.get("SIMULATION_PROFILE", "0") not in ("", "0"),
+    collect_interval=collect_interval,
+    collect_path=os.environ.get("SIMULATION_COLLECT_PATH"),
+    **load_map("default"),
+)
+
+
+# Step the model in the background, the routes only read its snapshots
+runner = SimulationRunner(
+    model,
+    tick_rate=float(os.environ.get("SIMULATION_TICK_RATE", 10)),
+    history=int(os.environ.get("SIMULATION_HISTORY", 256)),
 )
 
 
-cars = None
-trafficLights = None
+@app.before_request
+def start_simulation():
+    """
+    Start the background simulation loop with the first request.
+    """
+    runner.start()
 
 
 @app.route("/test")
@@ -58,38 +53,186 @@ def index():
     """
     Default route that returns a simple JSON message.
     """
-    global cars, trafficLights
-    model.step()
-    cars, trafficLights = model.get_global_map()
-    return jsonify({"Step": model.steps})
+    return jsonify({"Step": runner.latest().step})
 
 
 @app.route("/TestCars")
 def get_cars():
-    global cars
-    return jsonify(cars)
+    return jsonify(runner.latest().global_map["Cars"])
 
 
 @app.route("/TestTrafficLights")
 def get_trafficLights():
-    global trafficLights
-    model.step()
-    return jsonify(trafficLights)
+    return jsonify(runner.latest().global_map["Traffic_Lights"])
 
 
 @app.route("/global_map")
 def get_global_map():
     """
-    Route to get the global map of the model.
+    Route to get the global map of the model, of the latest step or of the
+    step given in the `step` query parameter while it is still buffered.
     """
-    # Run the model for a specified number of steps and store the global map
-    model.step()
-    # Obtén el mapa global
-    global_map = model.get_global_map()
+    step = request.args.get("step", default=None, type=int)
+    snapshot = runner.latest() if step is None else runner.get(step)
+    if snapshot is None:
+        return jsonify({"error": f"Step {step} is not available"}), 404
     # Envolver el mapa en una lista
-    return jsonify({"global_map": [global_map]})
+    return jsonify({"global_map": [snapshot.global_map]})
+
+
+@app.route("/metrics")
+def metrics():
+    """
+    Route with the step phase times and the car and traffic light counters
+    of the model in the Prometheus text format. They stay at zero unless
+    the server runs with SIMULATION_PROFILE set.
+    """
+    return Response(model.profiler.prometheus(), mimetype="text/plain; version=0.0.4")
+
+
+def format_event(event, data):
+    """
+    Format a server-sent event with a JSON payload.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route("/stream")
+def stream():
+    """
+    Route that streams the model as server-sent events. The first event is
+    a keyframe with the full state, then every step sends a delta with the
+    cars that moved, parked or left and the traffic lights that changed, and a
+    new keyframe every `keyframe_every` steps or when the client fell
+    behind the snapshot buffer.
+    """
+    keyframe_every = request.args.get("keyframe_every", default=50, type=int)
+    steps = request.args.get("steps", default=None, type=int)
+
+    def events():
+        snapshot = runner.latest()
+        yield format_event("keyframe", snapshot.keyframe)
+        sent = 0
+        while steps is None or sent < steps:
+            previous = snapshot
+            snapshot = runner.next_after(previous.step, timeout=15)
+            if snapshot is None:
+                # Keep the connection open while the simulation is paused
+                snapshot = previous
+                yield ": keep-alive\n\n"
+                continue
+            sent += 1
+            if snapshot.step != previous.step + 1 or (
+                keyframe_every > 0 and snapshot.step % keyframe_every == 0
+            ):
+                yield format_event("keyframe", snapshot.keyframe)
+            else:
+                yield format_event("delta", snapshot.delta)
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream")
+
+
+# Pool of worker processes running the sessions, started with the first one
+pool = None
+
+
+def get_pool():
+    """
+    Get the session pool, starting its worker processes if needed.
+    """
+    global pool
+    if pool is None:
+        pool = SessionPool(
+            workers=int(os.environ.get("SESSION_WORKERS", os.cpu_count())),
+            max_sessions=int(os.environ.get("SESSION_MAX", 32)),
+            idle_timeout=float(os.environ.get("SESSION_IDLE_TIMEOUT", 600)),
+            tick_rate=float(os.environ.get("SIMULATION_TICK_RATE", 10)),
+            collect_interval=collect_interval,
+        )
+    return pool
+
+
+@app.route("/sessions", methods=["POST"])
+def create_session():
+    """
+    Route to start a simulation of its own. The JSON body may set any of
+    the SESSION_PARAMETERS, such as num_agents, seed, map, engine,
+    spawn_rate or tick_rate.
+    """
+    try:
+        session_id = get_pool().create(request.get_json(silent=True) or {})
+    except (ValueError, RuntimeError) as error:
+        return jsonify({"error": str(error)}), 400
+    return jsonify({"session_id": session_id}), 201
+
+
+@app.route("/sessions")
+def list_sessions():
+    return jsonify({"sessions": get_pool().session_ids()})
+
+
+@app.route("/sessions/<session_id>", methods=["DELETE"])
+def close_session(session_id):
+    get_pool().close(session_id)
+    return "", 204
+
+
+@app.route("/sessions/<session_id>/global_map")
+def get_session_global_map(session_id):
+    """
+    Route to get the global map of a session, of its latest step or of the
+    step given in the `step` query parameter while it is still buffered.
+    """
+    step = request.args.get("step", default=None, type=int)
+    try:
+        snapshot = get_pool().snapshot(session_id, step)
+    except KeyError:
+        return jsonify({"error": f"Unknown session {session_id}"}), 404
+    if snapshot is None:
+        return jsonify({"error": f"Step {step} is not available"}), 404
+    return jsonify({"global_map": [snapshot.global_map]})
+
+
+@app.route("/sessions/<session_id>/stream")
+def stream_session(session_id):
+    """
+    Route that streams a session as server-sent events, like /stream.
+    """
+    keyframe_every = request.args.get("keyframe_every", default=50, type=int)
+    steps = request.args.get("steps", default=None, type=int)
+    sessions = get_pool()
+    try:
+        snapshot = sessions.snapshot(session_id)
+    except KeyError:
+        return jsonify({"error": f"Unknown session {session_id}"}), 404
+
+    def events():
+        nonlocal snapshot
+        yield format_event("keyframe", snapshot.keyframe)
+        sent = 0
+        while steps is None or sent < steps:
+            previous = snapshot
+            try:
+                snapshot = sessions.next_after(session_id, previous.step)
+            except KeyError:
+                # The session was closed or evicted
+                return
+            if snapshot is None:
+                snapshot = previous
+                time.sleep(0.01)
+                continue
+            sent += 1
+            if snapshot.step != previous.step + 1 or (
+                keyframe_every > 0 and snapshot.step % keyframe_every == 0
+            ):
+                yield format_event("keyframe", snapshot.keyframe)
+            else:
+                yield format_event("delta", snapshot.delta)
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream")
 
 
 if __name__ == "__main__":
     # Run the Flask application on localhost at port 3000
-    app.run(host="127.0.0.1", port=3000, debug=True)
+    # The reloader would run a second simulation loop in its watcher process
+    app.run(host="127.0.0.1", port=3000, debug=True, use_reloader=False)